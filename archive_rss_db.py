@@ -0,0 +1,324 @@
+import os
+import re
+import json
+import time
+import zlib
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+from extract_content import ensure_extract_table, extract_item, normalize_date, save_extract
+
+DB_PATH = "/home/yy/project/Gewechat/vxbot/data/message_monitor.db"
+# 冷数据归档库，存放压缩后的content和raw_data
+ARCHIVE_DB_PATH = "/home/yy/project/Gewechat/vxbot/data/message_archive.db"
+PDF_DIR = "/home/yy/project/Gewechat/vxbot/data/articles/pdfs"
+IMAGE_CACHE_DIR = "/home/yy/project/Gewechat/vxbot/data/articles/image_cache"
+
+IMAGE_DIR_RE = re.compile(r'^images_(\d+)$')
+
+
+def ensure_archive_tables(hot_conn, archive_conn):
+    """
+    创建热库中的归档索引表和归档库中的数据表（如果不存在）
+    """
+    hot_conn.execute("""
+        CREATE TABLE IF NOT EXISTS article_archive (
+            article_id INTEGER PRIMARY KEY,
+            archived_at TEXT
+        )
+    """)
+    archive_conn.execute("""
+        CREATE TABLE IF NOT EXISTS archived_articles (
+            article_id INTEGER PRIMARY KEY,
+            message_id TEXT,
+            content BLOB,
+            raw_data BLOB,
+            archived_at TEXT
+        )
+    """)
+
+
+def _compress(text):
+    return zlib.compress(text.encode('utf-8'), 9) if text is not None else None
+
+
+def _decompress(data):
+    return zlib.decompress(data).decode('utf-8') if data is not None else None
+
+
+def _check_sqlite(db_path):
+    if db_path.startswith(('postgresql://', 'postgres://')):
+        raise ValueError("归档和压缩仅支持SQLite数据库")
+
+
+def archive_old_articles(db_path=DB_PATH, archive_path=ARCHIVE_DB_PATH, older_than_days=180, batch_size=200):
+    """
+    将已处理的旧文章的content和raw_data压缩后移入归档库，热库中只保留元数据
+
+    参数:
+    - db_path: 热库文件路径
+    - archive_path: 归档库文件路径
+    - older_than_days: 发布时间早于该天数的文章才会归档
+    - batch_size: 每批归档的条目数
+
+    返回:
+    - 归档的条目数
+    """
+    _check_sqlite(db_path)
+    cutoff = (datetime.now() - timedelta(days=older_than_days)
+              ).strftime('%Y-%m-%d')
+
+    hot_conn = sqlite3.connect(db_path, timeout=20)
+    archive_conn = sqlite3.connect(archive_path, timeout=20)
+    try:
+        ensure_archive_tables(hot_conn, archive_conn)
+        ensure_extract_table(hot_conn.cursor())
+        hot_conn.commit()
+        archive_conn.commit()
+
+        archived_count = 0
+        last_id = 0
+        while True:
+            rows = hot_conn.execute("""
+                SELECT w.id, w.message_id, w.content, w.raw_data, w.account_name, w.created_at,
+                       e.article_id IS NOT NULL
+                FROM wechat_articles w
+                LEFT JOIN article_archive a ON a.article_id = w.id
+                LEFT JOIN article_extracts e ON e.article_id = w.id
+                WHERE w.article_type = 'RSS' AND w.processed = 1
+                  AND w.created_at < ? AND a.article_id IS NULL AND w.id > ?
+                ORDER BY w.id
+                LIMIT ?
+            """, (cutoff, last_id, batch_size)).fetchall()
+            if not rows:
+                break
+
+            archived_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # 先写入归档库并提交，再清空热库中的字段，中途失败时不会丢失数据
+            archive_conn.executemany("""
+                INSERT OR REPLACE INTO archived_articles
+                (article_id, message_id, content, raw_data, archived_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, [
+                (article_id, message_id, _compress(content), _compress(raw_data), archived_at)
+                for article_id, message_id, content, raw_data, _, _, _ in rows
+            ])
+            archive_conn.commit()
+
+            # 清空content前为尚未提取的文章补充提取结果，否则之后只能提取到空文本
+            cursor = hot_conn.cursor()
+            for article_id, _, content, raw_data, account_name, created_at, has_extract in rows:
+                if has_extract:
+                    continue
+                try:
+                    item = json.loads(raw_data) if raw_data else {}
+                except ValueError:
+                    item = {}
+                item['content_html'] = content or ''
+                extract = extract_item(item)
+                extract['author'] = extract['author'] or account_name or ''
+                extract['published_at'] = extract['published_at'] or normalize_date(created_at)
+                save_extract(cursor, article_id, extract)
+
+            article_ids = [row[0] for row in rows]
+            hot_conn.executemany("""
+                UPDATE wechat_articles SET content = NULL, raw_data = NULL WHERE id = ?
+            """, [(article_id,) for article_id in article_ids])
+            hot_conn.executemany("""
+                INSERT OR REPLACE INTO article_archive (article_id, archived_at) VALUES (?, ?)
+            """, [(article_id, archived_at) for article_id in article_ids])
+            hot_conn.commit()
+
+            last_id = article_ids[-1]
+            archived_count += len(rows)
+            print(f"已归档 {archived_count} 条")
+
+        return archived_count
+    finally:
+        hot_conn.close()
+        archive_conn.close()
+
+
+def load_archived(article_ids, archive_path=ARCHIVE_DB_PATH):
+    """
+    从归档库中读取文章的content和raw_data
+
+    参数:
+    - article_ids: 文章ID列表
+    - archive_path: 归档库文件路径
+
+    返回:
+    - 文章ID到{'content', 'raw_data'}的字典，不在归档库中的文章不包含在内
+    """
+    if not article_ids or not os.path.exists(archive_path):
+        return {}
+
+    conn = sqlite3.connect(archive_path, timeout=10)
+    try:
+        result = {}
+        ids = list(article_ids)
+        # 分批查询，避免超过SQLite的参数数量限制
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            rows = conn.execute(f"""
+                SELECT article_id, content, raw_data
+                FROM archived_articles
+                WHERE article_id IN ({', '.join('?' * len(batch))})
+            """, batch).fetchall()
+            for article_id, content, raw_data in rows:
+                result[article_id] = {
+                    'content': _decompress(content),
+                    'raw_data': _decompress(raw_data),
+                }
+        return result
+    except sqlite3.Error as e:
+        print(f"读取归档数据时出错: {e}")
+        return {}
+    finally:
+        conn.close()
+
+
+def get_article_content(article_id, db_path=DB_PATH, archive_path=ARCHIVE_DB_PATH):
+    """
+    读取文章的content和raw_data，已归档的文章自动从归档库读取
+
+    参数:
+    - article_id: 文章ID
+    - db_path: 热库文件路径
+    - archive_path: 归档库文件路径
+
+    返回:
+    - 包含content和raw_data的字典，文章不存在时返回None
+    """
+    conn = sqlite3.connect(db_path, timeout=10)
+    try:
+        row = conn.execute(
+            "SELECT content, raw_data FROM wechat_articles WHERE id = ?", (article_id,)).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+    if row[0] is None and row[1] is None:
+        archived = load_archived([article_id], archive_path)
+        if article_id in archived:
+            return archived[article_id]
+    return {'content': row[0], 'raw_data': row[1]}
+
+
+def prune_orphan_files(db_path=DB_PATH, pdf_dir=PDF_DIR, cache_dir=IMAGE_CACHE_DIR, max_age_hours=24):
+    """
+    清理孤立的图片目录、残留的临时HTML文件和未被引用的图片缓存
+
+    参数:
+    - db_path: 数据库文件路径
+    - pdf_dir: PDF存储目录
+    - cache_dir: 图片缓存目录
+    - max_age_hours: 临时文件和缓存文件超过该时长才会被清理，避免影响正在运行的处理任务
+
+    返回:
+    - 删除的文件和目录数
+    """
+    _check_sqlite(db_path)
+    min_mtime = time.time() - max_age_hours * 3600
+
+    conn = sqlite3.connect(db_path, timeout=10)
+    try:
+        article_ids = {row[0] for row in conn.execute("SELECT id FROM wechat_articles")}
+        referenced_images = set()
+        for (images,) in conn.execute("SELECT images FROM wechat_articles WHERE images IS NOT NULL"):
+            try:
+                referenced_images.update(json.loads(images))
+            except (ValueError, TypeError):
+                continue
+    finally:
+        conn.close()
+
+    removed_count = 0
+
+    if os.path.isdir(pdf_dir):
+        for name in os.listdir(pdf_dir):
+            path = os.path.join(pdf_dir, name)
+            match = IMAGE_DIR_RE.match(name)
+            if match and os.path.isdir(path):
+                # 文章已被删除，或原始图片已被压缩后的缓存替代
+                if os.path.getmtime(path) < min_mtime and \
+                        (int(match.group(1)) not in article_ids or not os.listdir(path)):
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed_count += 1
+            elif name.startswith('temp_') and name.endswith('.html') \
+                    and os.path.getmtime(path) < min_mtime:
+                os.remove(path)
+                removed_count += 1
+
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if path not in referenced_images and os.path.getmtime(path) < min_mtime:
+                os.remove(path)
+                removed_count += 1
+
+    print(f"已清理 {removed_count} 个文件或目录")
+    return removed_count
+
+
+def incremental_vacuum(db_path=DB_PATH, pages=None):
+    """
+    回收数据库空闲页。首次运行时会将数据库切换为增量回收模式，需要执行一次完整的VACUUM
+
+    参数:
+    - db_path: 数据库文件路径
+    - pages: 最多回收的页数，None表示全部回收
+
+    返回:
+    - 回收前后的空闲页数
+    """
+    _check_sqlite(db_path)
+    conn = sqlite3.connect(db_path, timeout=20)
+    try:
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        freelist_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        if auto_vacuum != 2:
+            # auto_vacuum模式只有在VACUUM之后才会生效
+            print("切换为增量回收模式，执行完整VACUUM...")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            # incremental_vacuum每执行一步只回收一页，而sqlite3模块对不返回列的语句只执行一步，
+            # 因此在同一事务中反复执行，直到空闲页不再减少或达到指定页数
+            target = freelist_before - int(pages) if pages else 0
+            freelist = freelist_before
+            conn.execute("BEGIN")
+            while freelist > max(target, 0):
+                conn.execute("PRAGMA incremental_vacuum(1)")
+                remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if remaining >= freelist:
+                    break
+                freelist = remaining
+        conn.commit()
+
+        freelist_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        print(f"空闲页: {freelist_before} -> {freelist_after}")
+        return freelist_before, freelist_after
+    finally:
+        conn.close()
+
+
+def run_retention(db_path=DB_PATH, archive_path=ARCHIVE_DB_PATH, older_than_days=180, pdf_dir=PDF_DIR,
+                  cache_dir=IMAGE_CACHE_DIR):
+    """
+    依次执行归档、清理孤立文件和增量回收
+
+    返回:
+    - 归档的条目数和清理的文件数
+    """
+    archived_count = archive_old_articles(db_path, archive_path, older_than_days)
+    removed_count = prune_orphan_files(db_path, pdf_dir, cache_dir)
+    incremental_vacuum(db_path)
+    return archived_count, removed_count
+
+
+if __name__ == "__main__":
+    archived_count, removed_count = run_retention()
+    print(f"归档 {archived_count} 条文章，清理 {removed_count} 个文件或目录")
@@ -0,0 +1,316 @@
+import os
+import re
+import base64
+import zipfile
+import mimetypes
+import uuid
+from datetime import datetime
+from html import escape
+from bs4 import BeautifulSoup, NavigableString, Comment
+
+# 导出文件存储路径，每种格式一个子目录
+EXPORT_DIR = "/home/yy/project/Gewechat/vxbot/data/articles/exports"
+
+# 支持的导出格式；除pdf外均不需要调用wkhtmltopdf
+EXPORT_FORMATS = ('pdf', 'html', 'md', 'txt', 'epub')
+# 需要下载图片到本地的格式
+IMAGE_FORMATS = ('pdf', 'html', 'epub')
+
+# 导出时需要删除的不安全标签
+UNSAFE_TAGS = ['script', 'iframe', 'object', 'embed', 'form', 'noscript']
+
+
+def safe_filename(name, max_length=50):
+    """
+    清理文件名，移除不合法字符并限制长度
+    """
+    return re.sub(r'[\\/*?:"<>|]', "", name)[:max_length]
+
+
+def export_path(fmt, filename):
+    """
+    获取导出文件的完整路径，并确保目录存在
+    """
+    fmt_dir = os.path.join(EXPORT_DIR, fmt)
+    os.makedirs(fmt_dir, exist_ok=True)
+    return os.path.join(fmt_dir, filename)
+
+
+def sanitize_soup(soup):
+    """
+    删除脚本、内嵌框架、事件属性等不安全内容
+    """
+    for tag in soup.find_all(UNSAFE_TAGS):
+        tag.decompose()
+    for comment in soup.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+    for tag in soup.find_all(True):
+        for attr in list(tag.attrs):
+            value = tag.attrs[attr]
+            if attr.lower().startswith('on'):
+                del tag.attrs[attr]
+            elif attr in ('href', 'src') and isinstance(value, str) \
+                    and value.strip().lower().startswith('javascript:'):
+                del tag.attrs[attr]
+    return soup
+
+
+def _image_data_uri(path):
+    """
+    将本地图片编码为data URI
+    """
+    mime_type = mimetypes.guess_type(path)[0] or 'image/jpeg'
+    with open(path, 'rb') as f:
+        data = base64.b64encode(f.read()).decode('ascii')
+    return f"data:{mime_type};base64,{data}"
+
+
+def render_html(full_html, out_path):
+    """
+    导出为独立的HTML文件，本地图片以data URI形式内联
+
+    参数:
+    - full_html: 已下载图片并添加标题信息的完整HTML
+    - out_path: 输出文件路径
+
+    返回:
+    - 输出文件路径
+    """
+    soup = sanitize_soup(BeautifulSoup(full_html, 'html.parser'))
+    for img in soup.find_all('img'):
+        src = img.get('src', '')
+        if src and os.path.isfile(src):
+            try:
+                img['src'] = _image_data_uri(src)
+            except OSError as e:
+                print(f"内联图片失败: {src}, 错误: {e}")
+
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write(str(soup))
+    return out_path
+
+
+def _inline_markdown(node):
+    """
+    将节点的子节点转换为行内Markdown文本
+    """
+    return ''.join(_node_to_markdown(child) for child in node.children)
+
+
+def _node_to_markdown(node):
+    """
+    递归地将HTML节点转换为Markdown
+    """
+    if isinstance(node, NavigableString):
+        return re.sub(r'\s+', ' ', str(node))
+
+    name = node.name
+    if name in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+        text = _inline_markdown(node).strip()
+        return f"\n\n{'#' * int(name[1])} {text}\n\n" if text else ''
+    if name == 'p':
+        text = _inline_markdown(node).strip()
+        return f"\n\n{text}\n\n" if text else ''
+    if name == 'br':
+        return '  \n'
+    if name == 'hr':
+        return '\n\n---\n\n'
+    if name in ('strong', 'b'):
+        text = _inline_markdown(node).strip()
+        return f"**{text}**" if text else ''
+    if name in ('em', 'i'):
+        text = _inline_markdown(node).strip()
+        return f"*{text}*" if text else ''
+    if name == 'a':
+        text = _inline_markdown(node).strip()
+        href = node.get('href', '')
+        return f"[{text}]({href})" if href and text else text
+    if name == 'img':
+        src = node.get('data-src') or node.get('src', '')
+        alt = node.get('alt', '')
+        return f"![{alt}]({src})" if src else ''
+    if name in ('pre', 'code'):
+        text = node.get_text()
+        if name == 'pre' or '\n' in text:
+            return f"\n\n```\n{text.strip()}\n```\n\n"
+        return f"`{text}`"
+    if name == 'blockquote':
+        text = _inline_markdown(node).strip()
+        lines = [f"> {line}" if line else '>' for line in text.splitlines()]
+        return '\n\n' + '\n'.join(lines) + '\n\n'
+    if name in ('ul', 'ol'):
+        items = []
+        for i, li in enumerate(node.find_all('li', recursive=False), 1):
+            prefix = f"{i}." if name == 'ol' else '-'
+            items.append(f"{prefix} {_inline_markdown(li).strip()}")
+        return '\n\n' + '\n'.join(items) + '\n\n'
+    if name in ('script', 'style', 'head', 'title'):
+        return ''
+    return _inline_markdown(node)
+
+
+def html_to_markdown(html_content):
+    """
+    将HTML内容转换为Markdown文本
+    """
+    soup = sanitize_soup(BeautifulSoup(html_content, 'html.parser'))
+    markdown = _node_to_markdown(soup)
+    markdown = re.sub(r'[ \t]+\n', '\n', markdown)
+    markdown = re.sub(r'\n{3,}', '\n\n', markdown)
+    return markdown.strip() + '\n'
+
+
+def html_to_text(html_content):
+    """
+    将HTML内容转换为纯文本，用于索引和检索
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for tag in soup.find_all(['script', 'style', 'head']):
+        tag.decompose()
+    text = soup.get_text('\n')
+    lines = [re.sub(r'\s+', ' ', line).strip() for line in text.splitlines()]
+    return '\n'.join(line for line in lines if line)
+
+
+def _article_header(title, author, date_text):
+    """
+    生成Markdown和纯文本导出的文章头部
+    """
+    lines = [title]
+    if author:
+        lines.append(f"作者: {author}")
+    if date_text:
+        lines.append(f"发布时间: {date_text}")
+    return lines
+
+
+def render_markdown(html_content, out_path, title, author="", date_text=""):
+    """
+    导出为Markdown文件，图片保留原始链接
+    """
+    header = _article_header(f"# {title}", author, date_text)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write('\n\n'.join(header) + '\n\n' + html_to_markdown(html_content))
+    return out_path
+
+
+def render_text(html_content, out_path, title, author="", date_text="", text=None):
+    """
+    导出为纯文本文件，text为已提取的纯文本时直接使用
+    """
+    header = _article_header(title, author, date_text)
+    if text is None:
+        text = html_to_text(html_content)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(header) + '\n\n' + text + '\n')
+    return out_path
+
+
+def _epub_chapter(title, body_html):
+    """
+    生成EPUB章节的XHTML文档
+    """
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><meta charset="UTF-8"/><title>{escape(title)}</title></head>
+<body>
+{body_html}
+</body>
+</html>
+"""
+
+
+def render_epub(articles, out_path, book_title, author=""):
+    """
+    将多篇文章打包为一个EPUB文件
+
+    参数:
+    - articles: 文章列表，每项为包含title、html、image_paths的字典，html为完整HTML
+    - out_path: 输出文件路径
+    - book_title: 电子书标题
+    - author: 电子书作者
+
+    返回:
+    - 输出文件路径
+    """
+    book_id = f"urn:uuid:{uuid.uuid4()}"
+    modified = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    manifest = []
+    spine = []
+    nav_items = []
+
+    with zipfile.ZipFile(out_path, 'w') as zf:
+        # mimetype必须是第一个文件且不压缩
+        zf.writestr('mimetype', 'application/epub+zip',
+                    compress_type=zipfile.ZIP_STORED)
+        zf.writestr('META-INF/container.xml', """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+""", compress_type=zipfile.ZIP_DEFLATED)
+
+        for i, article in enumerate(articles, 1):
+            soup = sanitize_soup(BeautifulSoup(article['html'], 'html.parser'))
+            # prepare_article_html会在原文外再包一层html/body，取最内层的body作为章节内容
+            bodies = soup.find_all('body')
+            body = bodies[-1] if bodies else soup
+
+            # 将本地图片打包进EPUB并替换路径
+            for n, img in enumerate(body.find_all('img')):
+                src = img.get('src', '')
+                if not src or not os.path.isfile(src):
+                    img.decompose()
+                    continue
+                image_name = f"images/{i}_{n}_{os.path.basename(src)}"
+                zf.write(src, f"OEBPS/{image_name}",
+                         compress_type=zipfile.ZIP_STORED)
+                mime_type = mimetypes.guess_type(src)[0] or 'image/jpeg'
+                manifest.append(
+                    f'<item id="img{i}_{n}" href="{escape(image_name)}" media-type="{mime_type}"/>')
+                img['src'] = image_name
+
+            chapter_name = f"chapter_{i}.xhtml"
+            body_html = ''.join(str(child) for child in body.children)
+            zf.writestr(f"OEBPS/{chapter_name}",
+                        _epub_chapter(article['title'], body_html),
+                        compress_type=zipfile.ZIP_DEFLATED)
+            manifest.append(
+                f'<item id="ch{i}" href="{chapter_name}" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="ch{i}"/>')
+            nav_items.append(
+                f'<li><a href="{chapter_name}">{escape(article["title"])}</a></li>')
+
+        nav_list = '\n'.join(nav_items)
+        zf.writestr('OEBPS/nav.xhtml', _epub_chapter(book_title, f"""<nav epub:type="toc" id="toc">
+<h1>目录</h1>
+<ol>
+{nav_list}
+</ol>
+</nav>"""), compress_type=zipfile.ZIP_DEFLATED)
+
+        manifest_items = '\n    '.join(manifest)
+        spine_items = '\n    '.join(spine)
+        zf.writestr('OEBPS/content.opf', f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="book-id">{book_id}</dc:identifier>
+    <dc:title>{escape(book_title)}</dc:title>
+    <dc:creator>{escape(author)}</dc:creator>
+    <dc:language>zh</dc:language>
+    <meta property="dcterms:modified">{modified}</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+    {manifest_items}
+  </manifest>
+  <spine>
+    {spine_items}
+  </spine>
+</package>
+""", compress_type=zipfile.ZIP_DEFLATED)
+
+    return out_path
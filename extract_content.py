@@ -0,0 +1,180 @@
+import re
+import json
+import sqlite3
+from datetime import datetime
+from bs4 import BeautifulSoup
+from export_formats import html_to_text
+
+DB_PATH = "/home/yy/project/Gewechat/vxbot/data/message_monitor.db"
+
+# 中日韩文字按字计数，其他文字按词计数
+CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['\-][A-Za-z0-9]+)*")
+
+
+def _check_sqlite(db_path):
+    if db_path.startswith(('postgresql://', 'postgres://')):
+        raise ValueError("补充提取仅支持SQLite数据库，PostgreSQL中的文章在入库时已提取")
+
+
+def ensure_extract_table(cursor):
+    """
+    创建存储预提取内容的表（如果不存在）
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS article_extracts (
+            article_id INTEGER PRIMARY KEY,
+            text TEXT,
+            word_count INTEGER,
+            image_urls TEXT,
+            author TEXT,
+            published_at TEXT,
+            extracted_at TEXT
+        )
+    """)
+
+
+def count_words(text):
+    """
+    统计字数，中文按字计数，英文和数字按词计数
+    """
+    return len(CJK_RE.findall(text)) + len(WORD_RE.findall(text))
+
+
+def extract_image_urls(html_content):
+    """
+    提取HTML中的图片链接，去重并保持原有顺序
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    image_urls = []
+    for img in soup.find_all('img'):
+        # 微信文章的图片地址通常在data-src中
+        src = img.get('data-src') or img.get('src', '')
+        if not src or src.startswith('data:'):
+            continue
+        if src.startswith('//'):
+            src = 'https:' + src
+        if src not in image_urls:
+            image_urls.append(src)
+    return image_urls
+
+
+def normalize_date(date_text):
+    """
+    将ISO格式的日期统一为 YYYY-mm-dd HH:MM:SS，无法解析时原样返回
+    """
+    if not date_text:
+        return ''
+    try:
+        dt = datetime.fromisoformat(date_text.replace('Z', '+00:00'))
+        return dt.strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return date_text
+
+
+def extract_item(item):
+    """
+    从RSS条目中提取纯文本、字数、图片列表、作者和日期
+
+    参数:
+    - item: RSS条目（fetch_rss返回的JSON字典）
+
+    返回:
+    - 提取结果字典
+    """
+    content = item.get('content_html', '') or ''
+
+    author_obj = item.get('author', {})
+    if isinstance(author_obj, dict):
+        author = author_obj.get('name', '')
+    elif isinstance(author_obj, str):
+        author = author_obj
+    else:
+        author = ''
+
+    text = html_to_text(content) if content else ''
+    return {
+        'text': text,
+        'word_count': count_words(text),
+        'image_urls': extract_image_urls(content) if content else [],
+        'author': author,
+        'published_at': normalize_date(item.get('date_modified', '')),
+    }
+
+
+def save_extract(cursor, article_id, extract):
+    """
+    保存文章的提取结果
+    """
+    cursor.execute("""
+        INSERT OR REPLACE INTO article_extracts
+        (article_id, text, word_count, image_urls, author, published_at, extracted_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (
+        article_id,
+        extract['text'],
+        extract['word_count'],
+        json.dumps(extract['image_urls'], ensure_ascii=False),
+        extract['author'],
+        extract['published_at'],
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    ))
+
+
+def backfill_extracts(db_path=DB_PATH, batch_size=200):
+    """
+    为入库时尚未提取内容的历史文章补充提取结果
+
+    参数:
+    - db_path: 数据库文件路径
+    - batch_size: 每批处理的条目数
+
+    返回:
+    - 补充提取的条目数
+    """
+    _check_sqlite(db_path)
+    conn = sqlite3.connect(db_path, timeout=20)
+    try:
+        cursor = conn.cursor()
+        ensure_extract_table(cursor)
+
+        extracted_count = 0
+        last_id = 0
+        while True:
+            cursor.execute("""
+                SELECT w.id, w.content, w.raw_data, w.account_name, w.created_at
+                FROM wechat_articles w
+                LEFT JOIN article_extracts e ON e.article_id = w.id
+                WHERE w.article_type = 'RSS' AND e.article_id IS NULL AND w.id > ?
+                ORDER BY w.id
+                LIMIT ?
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            for article_id, content, raw_data, account_name, created_at in rows:
+                last_id = article_id
+                try:
+                    item = json.loads(raw_data) if raw_data else {}
+                except ValueError:
+                    item = {}
+                item['content_html'] = content or ''
+                extract = extract_item(item)
+                extract['author'] = extract['author'] or account_name or ''
+                extract['published_at'] = extract['published_at'] or normalize_date(created_at)
+                save_extract(cursor, article_id, extract)
+                extracted_count += 1
+
+            conn.commit()
+            print(f"已补充提取 {extracted_count} 条")
+
+        return extracted_count
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # 为历史文章补充提取结果
+    count = backfill_extracts()
+    print(f"共补充提取 {count} 条")
@@ -52,7 +52,7 @@ def get_feed(feed_id=None, format="json", title_include=None, title_exclude=None
         return None
 
 
-def get_all_items(feed_id=None, title_include=None, title_exclude=None, batch_size=100, page_size=1):
+def get_all_items(feed_id=None, title_include=None, title_exclude=None, batch_size=100, page_size=1, item_filter=None):
     """
     获取所有RSS条目，通过分页方式获取全部内容
 
@@ -62,10 +62,16 @@ def get_all_items(feed_id=None, title_include=None, title_exclude=None, batch_si
     - title_exclude: 标题排除的关键词，可以是单个词或用|分隔的多个词
     - batch_size: 每次请求的条目数量
     - page_size: 获取的页数
+    - item_filter: 本地过滤函数（见filter_rss.compile_item_filter），每批条目到达时即过滤
 
     返回:
     - 包含所有条目的列表
     """
+    # 只按标题过滤时，将关键词下推到服务端，减少需要传输和解析的条目
+    if item_filter is not None:
+        title_include = title_include or getattr(item_filter, 'title_include', None)
+        title_exclude = title_exclude or getattr(item_filter, 'title_exclude', None)
+
     all_items = []
     page = 1
     while True:
@@ -88,8 +94,13 @@ def get_all_items(feed_id=None, title_include=None, title_exclude=None, batch_si
         if not current_items:
             break
 
-        # 添加当前批次的条目到结果列表
-        all_items.extend(current_items)
+        # 添加当前批次的条目到结果列表，不符合过滤条件的条目直接丢弃
+        if item_filter:
+            kept_items = [item for item in current_items if item_filter(item)]
+            print(f"过滤后保留 {len(kept_items)}/{len(current_items)} 条")
+            all_items.extend(kept_items)
+        else:
+            all_items.extend(current_items)
 
         # 如果返回的条目数小于请求的批次大小，说明已经获取完所有条目
         if len(current_items) < batch_size:
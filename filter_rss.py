@@ -0,0 +1,134 @@
+import re
+
+try:
+    import ahocorasick  # pyahocorasick，可选
+except ImportError:
+    ahocorasick = None
+
+# 可用于关键词匹配的条目字段
+FILTER_FIELDS = ('title', 'author', 'text')
+
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+class KeywordMatcher:
+    """
+    多关键词匹配器（不区分大小写）。安装了pyahocorasick时使用其C实现的Aho-Corasick自动机，
+    否则使用编译后的正则表达式多选分支，两者都只需扫描一遍文本
+    """
+
+    def __init__(self, keywords):
+        self.keywords = [k.lower() for k in keywords if k]
+        self.automaton = None
+        self.pattern = None
+        if not self.keywords:
+            return
+
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self.automaton.add_word(keyword, keyword)
+            self.automaton.make_automaton()
+        else:
+            # 长关键词优先，避免被其前缀提前匹配
+            keywords = sorted(set(self.keywords), key=len, reverse=True)
+            self.pattern = re.compile(
+                '|'.join(map(re.escape, keywords)), re.IGNORECASE)
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def contains_any(self, text):
+        """
+        判断文本中是否出现任一关键词，匹配到第一个即返回
+        """
+        if not self.keywords or not text:
+            return False
+        if self.automaton is not None:
+            for _ in self.automaton.iter(text.lower()):
+                return True
+            return False
+        return self.pattern.search(text) is not None
+
+
+def split_keywords(keywords):
+    """
+    将关键词统一为列表，支持列表或用|分隔的字符串
+    """
+    if not keywords:
+        return []
+    if isinstance(keywords, str):
+        keywords = keywords.split('|')
+    return [k.strip() for k in keywords if k and k.strip()]
+
+
+def _item_account(item):
+    author_obj = item.get('author', {})
+    if isinstance(author_obj, dict):
+        return author_obj.get('name', '') or ''
+    return author_obj if isinstance(author_obj, str) else ''
+
+
+def _item_field(item, field):
+    """
+    获取条目中用于匹配的字段文本
+    """
+    if field == 'title':
+        return item.get('title', '') or ''
+    if field == 'author':
+        return _item_account(item)
+    # 正文只需去掉标签即可匹配，不做完整的HTML解析
+    return TAG_RE.sub(' ', item.get('content_html', '') or '')
+
+
+def compile_item_filter(include=None, exclude=None, fields=('title',), account_allow=None, account_deny=None):
+    """
+    编译条目过滤器
+
+    参数:
+    - include: 包含关键词，列表或用|分隔的字符串；指定时条目需至少匹配一个
+    - exclude: 排除关键词，匹配任一即丢弃
+    - fields: 参与关键词匹配的字段，可选title、author、text
+    - account_allow: 账号白名单，指定时只保留这些账号的条目
+    - account_deny: 账号黑名单
+
+    返回:
+    - 过滤函数，接收RSS条目，返回是否保留；title_include/title_exclude属性为可下推到服务端的参数
+    """
+    unknown_fields = [field for field in fields if field not in FILTER_FIELDS]
+    if unknown_fields:
+        raise ValueError(f"不支持的过滤字段: {', '.join(unknown_fields)}")
+
+    include_keywords = split_keywords(include)
+    exclude_keywords = split_keywords(exclude)
+    include_matcher = KeywordMatcher(include_keywords)
+    exclude_matcher = KeywordMatcher(exclude_keywords)
+    allow = set(split_keywords(account_allow))
+    deny = set(split_keywords(account_deny))
+
+    def item_filter(item):
+        account = _item_account(item)
+        if allow and account not in allow:
+            return False
+        if account in deny:
+            return False
+
+        if include_matcher or exclude_matcher:
+            texts = [_item_field(item, field) for field in fields]
+            if exclude_matcher and any(exclude_matcher.contains_any(text) for text in texts):
+                return False
+            if include_matcher and not any(include_matcher.contains_any(text) for text in texts):
+                return False
+        return True
+
+    # 只按标题过滤时，关键词可以下推到服务端（get_all_items会作为title_include/title_exclude传递），
+    # 本地仍会再过滤一次
+    if tuple(fields) == ('title',):
+        item_filter.title_include = '|'.join(include_keywords) or None
+        item_filter.title_exclude = '|'.join(exclude_keywords) or None
+    else:
+        item_filter.title_include = None
+        item_filter.title_exclude = None
+
+    return item_filter
+
@@ -1,6 +1,5 @@
 import os
 import pdfkit
-import re
 import sqlite3
 import json
 import time
@@ -8,6 +7,10 @@ from datetime import datetime
 from bs4 import BeautifulSoup
 import requests
 from urllib.parse import urljoin
+from image_processing import optimize_images
+from storage import PROCESSED_FORMAT, get_repository, default_worker_id
+from export_formats import (EXPORT_FORMATS, IMAGE_FORMATS, safe_filename, export_path,
+                            render_html, render_markdown, render_text, render_epub)
 
 # PDF 存储路径
 PDF_DIR = "/home/yy/project/Gewechat/vxbot/data/articles/pdfs"
@@ -16,6 +19,27 @@ DB_PATH = "/home/yy/project/Gewechat/vxbot/data/message_monitor.db"
 # 确保PDF目录存在
 os.makedirs(PDF_DIR, exist_ok=True)
 
+# 配置pdfkit选项
+PDF_OPTIONS = {
+    'page-size': 'A4',
+    'margin-top': '0.75in',
+    'margin-right': '0.75in',
+    'margin-bottom': '0.75in',
+    'margin-left': '0.75in',
+    'encoding': 'UTF-8',
+    'no-outline': None,
+    'enable-local-file-access': None,  # 允许访问本地文件
+    '--enable-javascript': None,
+    '--javascript-delay': '1000',
+    '--no-stop-slow-scripts': None,
+    '--zoom': '1.0',  # 设置缩放比例
+    '--disable-smart-shrinking': None,  # 禁用智能缩小
+    '--print-media-type': None,  # 使用打印媒体类型
+    '--dpi': '300',  # 设置更高的DPI
+    '--footer-right': '[page]/[topage]',  # 添加页码
+    '--footer-font-size': '9'
+}
+
 
 def clean_html(html_content):
     """
@@ -151,9 +175,24 @@ def download_images(html_content, article_id):
     return str(soup), image_paths
 
 
-def html_to_pdf(html_content, title, article_id, author="", date_modified=""):
+def format_article_date(date_modified):
     """
-    将HTML内容转换为PDF
+    将文章日期格式化为 YYYY-mm-dd HH:MM:SS，无法解析时原样返回
+    """
+    formatted_date = ""
+    if date_modified:
+        try:
+            # 尝试解析ISO格式的日期
+            dt = datetime.fromisoformat(date_modified.replace('Z', '+00:00'))
+            formatted_date = dt.strftime('%Y-%m-%d %H:%M:%S')
+        except:
+            formatted_date = date_modified
+    return formatted_date
+
+
+def prepare_article_html(html_content, title, article_id, author="", date_modified=""):
+    """
+    下载并压缩图片，添加标题、作者和日期信息，生成各导出格式共用的完整HTML
 
     参数:
     - html_content: HTML内容
@@ -163,28 +202,16 @@ def html_to_pdf(html_content, title, article_id, author="", date_modified=""):
     - date_modified: 文章修改时间
 
     返回:
-    - PDF文件路径
+    - 完整的HTML内容和本地图片路径列表
     """
-    # 清理文件名，移除不合法字符
-    safe_title = re.sub(r'[\\/*?:"<>|]', "", title)
-    safe_title = safe_title[:50]  # 限制长度
-
-    # 生成PDF文件名
-    pdf_filename = f"{article_id}_{safe_title}.pdf"
-    pdf_path = os.path.join(PDF_DIR, pdf_filename)
-
     # 清理和下载图片
     cleaned_html, image_paths = download_images(html_content, article_id)
 
+    # 缩放并重新压缩图片，减小PDF体积和渲染时间
+    cleaned_html, image_paths = optimize_images(cleaned_html, image_paths)
+
     # 格式化日期
-    formatted_date = ""
-    if date_modified:
-        try:
-            # 尝试解析ISO格式的日期
-            dt = datetime.fromisoformat(date_modified.replace('Z', '+00:00'))
-            formatted_date = dt.strftime('%Y-%m-%d %H:%M:%S')
-        except:
-            formatted_date = date_modified
+    formatted_date = format_article_date(date_modified)
 
     # 添加标题、作者和日期到HTML内容的开头
     header_html = f"""
@@ -229,140 +256,393 @@ def html_to_pdf(html_content, title, article_id, author="", date_modified=""):
         cleaned_html = '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="UTF-8">\n</head>\n<body>\n' + \
             cleaned_html + '\n</body>\n</html>'
 
+    return cleaned_html, image_paths
+
+
+def render_pdf(full_html, title, article_id):
+    """
+    调用wkhtmltopdf将完整的HTML渲染为PDF
+
+    参数:
+    - full_html: prepare_article_html生成的完整HTML
+    - title: 文章标题
+    - article_id: 文章ID
+
+    返回:
+    - PDF文件路径，失败时返回None
+    """
+    # 生成PDF文件名
+    pdf_filename = f"{article_id}_{safe_filename(title)}.pdf"
+    pdf_path = os.path.join(PDF_DIR, pdf_filename)
+
     # 将HTML内容保存到临时文件
     temp_html_path = os.path.join(PDF_DIR, f"temp_{article_id}.html")
     with open(temp_html_path, 'w', encoding='utf-8') as f:
-        f.write(cleaned_html)
-
-    # 配置pdfkit选项
-    options = {
-        'page-size': 'A4',
-        'margin-top': '0.75in',
-        'margin-right': '0.75in',
-        'margin-bottom': '0.75in',
-        'margin-left': '0.75in',
-        'encoding': 'UTF-8',
-        'no-outline': None,
-        'enable-local-file-access': None,  # 允许访问本地文件
-        '--enable-javascript': None,
-        '--javascript-delay': '1000',
-        '--no-stop-slow-scripts': None,
-        '--zoom': '1.0',  # 设置缩放比例
-        '--disable-smart-shrinking': None,  # 禁用智能缩小
-        '--print-media-type': None,  # 使用打印媒体类型
-        '--dpi': '300',  # 设置更高的DPI
-        '--footer-right': '[page]/[topage]',  # 添加页码
-        '--footer-font-size': '9'
-    }
+        f.write(full_html)
 
     try:
         # 从文件生成PDF而不是从字符串生成
-        pdfkit.from_file(temp_html_path, pdf_path, options=options)
+        pdfkit.from_file(temp_html_path, pdf_path, options=PDF_OPTIONS)
         print(f"PDF生成成功: {pdf_path}")
 
         # 清理临时文件
         os.remove(temp_html_path)
 
-        return pdf_path, image_paths
+        return pdf_path
     except Exception as e:
         print(f"生成PDF失败: {e}")
         # 清理临时文件
         if os.path.exists(temp_html_path):
             os.remove(temp_html_path)
-        return None, []
+        return None
 
 
-def process_rss_to_pdf(db_path=DB_PATH, limit=10):
+def html_to_pdf(html_content, title, article_id, author="", date_modified=""):
+    """
+    将HTML内容转换为PDF
+
+    参数:
+    - html_content: HTML内容
+    - title: 文章标题
+    - article_id: 文章ID
+    - author: 文章作者
+    - date_modified: 文章修改时间
+
+    返回:
+    - PDF文件路径
+    """
+    full_html, image_paths = prepare_article_html(
+        html_content, title, article_id, author, date_modified)
+
+    pdf_path = render_pdf(full_html, title, article_id)
+    if pdf_path:
+        return pdf_path, image_paths
+    return None, []
+
+
+def resolve_author_date(account_name, from_user, created_at, raw_data,
+                        extracted_author=None, extracted_date=None):
+    """
+    获取文章的作者和日期，数据库字段缺失时依次使用入库时的提取结果和raw_data
+
+    返回:
+    - 作者和日期
     """
-    处理数据库中未处理的RSS条目，生成PDF
+    # 获取作者信息
+    author = from_user or account_name or extracted_author
+
+    # 获取日期信息
+    date_modified = created_at or extracted_date
+
+    # 尝试从raw_data中提取更多信息
+    if raw_data and not (author and date_modified):
+        try:
+            raw_data_json = json.loads(raw_data)
+            if not author and 'author' in raw_data_json:
+                if isinstance(raw_data_json['author'], dict) and 'name' in raw_data_json['author']:
+                    author = raw_data_json['author']['name']
+                elif isinstance(raw_data_json['author'], str):
+                    author = raw_data_json['author']
+
+            if not date_modified and 'date_modified' in raw_data_json:
+                date_modified = raw_data_json['date_modified']
+        except:
+            pass
+
+    return author, date_modified
+
+
+def render_pdf_digest(articles, digest_name):
+    """
+    将多篇文章合并渲染为一个带目录的PDF，wkhtmltopdf只启动一次
 
     参数:
-    - db_path: 数据库路径
+    - articles: 文章列表，每项为包含id和html的字典，html为prepare_article_html生成的完整HTML
+    - digest_name: 合集名称，用于生成文件名
+
+    返回:
+    - PDF文件路径，失败时返回None
+    """
+    pdf_filename = f"digest_{safe_filename(digest_name)}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
+    pdf_path = os.path.join(PDF_DIR, pdf_filename)
+
+    # 每篇文章写入一个临时文件，作为wkhtmltopdf的多个输入
+    temp_html_paths = []
+    for article in articles:
+        temp_html_path = os.path.join(PDF_DIR, f"temp_{article['id']}.html")
+        with open(temp_html_path, 'w', encoding='utf-8') as f:
+            f.write(article['html'])
+        temp_html_paths.append(temp_html_path)
+
+    # 目录依赖文档大纲，因此去掉no-outline选项
+    options = {k: v for k, v in PDF_OPTIONS.items() if k != 'no-outline'}
+    options['outline-depth'] = '1'
+    toc = {'toc-header-text': '目录', 'toc-level-indentation': '1em'}
+
+    try:
+        pdfkit.from_file(temp_html_paths, pdf_path, options=options, toc=toc)
+        print(f"合集PDF生成成功: {pdf_path} ({len(articles)}篇)")
+        return pdf_path
+    except Exception as e:
+        print(f"生成合集PDF失败: {e}")
+        return None
+    finally:
+        # 清理临时文件
+        for temp_html_path in temp_html_paths:
+            if os.path.exists(temp_html_path):
+                os.remove(temp_html_path)
+
+
+def export_article(content, title, article_id, author="", date_modified="", formats=('pdf',), text=None):
+    """
+    将单篇文章导出为指定格式（EPUB除外，EPUB按账号合并导出）
+
+    参数:
+    - content: 文章HTML内容
+    - title: 文章标题
+    - article_id: 文章ID
+    - author: 文章作者
+    - date_modified: 文章修改时间
+    - formats: 导出格式列表
+    - text: 入库时提取的纯文本，提供时txt格式不再解析HTML
+
+    返回:
+    - 格式到文件路径的字典（失败的格式不包含在内）、完整HTML和图片路径列表
+    """
+    outputs = {}
+    full_html, image_paths = None, []
+    base_name = f"{article_id}_{safe_filename(title)}"
+
+    # 只有需要本地图片的格式才下载图片
+    if any(fmt in IMAGE_FORMATS for fmt in formats):
+        full_html, image_paths = prepare_article_html(
+            content, title, article_id, author, date_modified)
+
+    try:
+        if 'pdf' in formats:
+            pdf_path = render_pdf(full_html, title, article_id)
+            if pdf_path:
+                outputs['pdf'] = pdf_path
+
+        if 'html' in formats:
+            outputs['html'] = render_html(
+                full_html, export_path('html', f"{base_name}.html"))
+
+        formatted_date = format_article_date(date_modified)
+        if 'md' in formats:
+            outputs['md'] = render_markdown(
+                content, export_path('md', f"{base_name}.md"), title, author, formatted_date)
+
+        if 'txt' in formats:
+            outputs['txt'] = render_text(
+                content, export_path('txt', f"{base_name}.txt"), title, author, formatted_date, text)
+    except Exception as e:
+        print(f"导出文章失败: {title}, 错误: {e}")
+
+    return outputs, full_html, image_paths
+
+
+def process_rss_to_pdf(db_path=DB_PATH, limit=10, formats=('pdf',)):
+    """
+    处理数据库中未处理的RSS条目，生成PDF或其他导出格式
+
+    参数:
+    - db_path: 数据库路径，或postgresql://开头的PostgreSQL连接串
     - limit: 每次处理的最大条目数
+    - formats: 导出格式列表，可选pdf、html、md、txt、epub；
+      不包含pdf时不会调用wkhtmltopdf，也不会改变文章的processed状态，而是处理尚未导出这些格式的文章；
+      epub按账号将本次处理的文章合并为一个文件
 
     返回:
     - 成功处理的条目数
     """
+    unknown_formats = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+    if unknown_formats:
+        raise ValueError(f"不支持的导出格式: {', '.join(unknown_formats)}")
+
+    worker_id = default_worker_id()
+    # 只有包含pdf的处理才更新processed，其余格式只记录导出结果，不占用PDF的待处理队列
+    mark_as_processed = PROCESSED_FORMAT in formats
+
     # 添加重试机制处理数据库锁定问题
     max_retries = 5
     retry_delay = 1  # 初始延迟1秒
 
     for attempt in range(max_retries):
         try:
-            conn = sqlite3.connect(db_path, timeout=20)
-            cursor = conn.cursor()
-
-            # 查询未处理的RSS条目
-            cursor.execute("""
-                SELECT id, message_id, title, content, account_name, from_user, created_at, raw_data
-                FROM wechat_articles
-                WHERE article_type = 'RSS' AND processed = 0
-                LIMIT ?
-            """, (limit,))
-
-            items = cursor.fetchall()
+            repo = get_repository(db_path)
+
+            # 认领未处理的RSS条目，多个进程同时运行时不会重复处理
+            items = repo.claim_unprocessed(limit, worker_id, formats=formats)
             processed_count = 0
+            # 按账号收集需要打包为EPUB的文章
+            epub_articles = {}
 
             for item in items:
-                article_id, message_id, title, content, account_name, from_user, created_at, raw_data = item
+                (article_id, message_id, title, content, account_name, from_user, created_at, raw_data,
+                 extracted_author, extracted_date, extracted_text) = item
 
                 if not content:
                     print(f"跳过无内容的文章: {title}")
                     # 标记为已处理，但不生成PDF
-                    cursor.execute("""
-                        UPDATE wechat_articles
-                        SET processed = 1, process_time = ?
-                        WHERE id = ?
-                    """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), article_id))
-                    processed_count += 1
+                    if repo.mark_processed(article_id, worker_id):
+                        processed_count += 1
                     continue
 
                 print(f"处理文章: {title} ({account_name})")
 
-                # 获取作者信息
-                author = from_user or account_name
-
-                # 获取日期信息
-                date_modified = created_at
-
-                # 尝试从raw_data中提取更多信息
-                if raw_data:
-                    try:
-                        raw_data_json = json.loads(raw_data)
-                        if not author and 'author' in raw_data_json:
-                            if isinstance(raw_data_json['author'], dict) and 'name' in raw_data_json['author']:
-                                author = raw_data_json['author']['name']
-                            elif isinstance(raw_data_json['author'], str):
-                                author = raw_data_json['author']
-
-                        if not date_modified and 'date_modified' in raw_data_json:
-                            date_modified = raw_data_json['date_modified']
-                    except:
-                        pass
-
-                # 生成PDF
-                pdf_path, image_paths = html_to_pdf(
-                    content, title, article_id, author, date_modified)
+                # 获取作者和日期信息
+                author, date_modified = resolve_author_date(
+                    account_name, from_user, created_at, raw_data, extracted_author, extracted_date)
+
+                # 生成各格式的导出文件
+                outputs, full_html, image_paths = export_article(
+                    content, title, article_id, author, date_modified, formats, extracted_text)
+                # 每篇文章处理完后续期认领，避免批次耗时超过CLAIM_TIMEOUT_MINUTES后被其他进程接管
+                repo.renew_claims(worker_id)
+
+                # 所有单篇格式都导出成功才继续，否则保持未处理状态以便下次重试
+                if not all(fmt in outputs for fmt in formats if fmt != 'epub'):
+                    continue
 
-                if pdf_path:
-                    # 更新数据库
-                    cursor.execute("""
-                        UPDATE wechat_articles
-                        SET processed = 1, process_time = ?, pdf_path = ?, images = ?
-                        WHERE id = ?
-                    """, (
-                        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        pdf_path,
-                        json.dumps(image_paths),
-                        article_id
-                    ))
+                if 'epub' in formats:
+                    # 需要EPUB的文章等EPUB生成成功后再标记为已处理
+                    epub_articles.setdefault(account_name, []).append({
+                        'id': article_id,
+                        'title': title,
+                        'html': full_html,
+                        'image_paths': image_paths,
+                        'outputs': outputs,
+                    })
+                    continue
+
+                # 每条单独提交，避免长事务
+                if repo.mark_processed(
+                        article_id, worker_id, outputs.get('pdf'), image_paths, outputs, mark_as_processed):
                     processed_count += 1
                     print(f"已更新数据库: {title}")
 
-                # 每处理一条提交一次，避免长事务
-                conn.commit()
+            # 每个账号的文章合并为一个EPUB
+            for account_name, articles in epub_articles.items():
+                epub_name = f"{safe_filename(account_name or 'unknown')}_{datetime.now().strftime('%Y%m%d%H%M%S')}.epub"
+                try:
+                    epub_path = render_epub(
+                        articles, export_path('epub', epub_name), account_name or 'RSS', account_name)
+                    print(f"EPUB生成成功: {epub_path}")
+                except Exception as e:
+                    # 这些文章未被标记为已处理，认领释放后下次会重新处理
+                    print(f"生成EPUB失败: {account_name}, 错误: {e}")
+                    continue
+                repo.renew_claims(worker_id)
+                for article in articles:
+                    outputs = dict(article['outputs'], epub=epub_path)
+                    if repo.mark_processed(article['id'], worker_id, outputs.get('pdf'), article['image_paths'],
+                                           outputs, mark_as_processed):
+                        processed_count += 1
+                        print(f"已更新数据库: {article['title']}")
+
+            return processed_count
+
+        except sqlite3.OperationalError as e:
+            if "database is locked" in str(e) and attempt < max_retries - 1:
+                print(f"数据库被锁定，尝试重试 ({attempt+1}/{max_retries})...")
+                time.sleep(retry_delay)
+                retry_delay *= 2  # 指数退避
+                continue
+            else:
+                print(f"数据库错误: {e}")
+                raise
+        finally:
+            # 释放未完成的认领并确保连接被关闭
+            if 'repo' in locals() and repo:
+                try:
+                    repo.release_claims(worker_id)
+                    repo.close()
+                except:
+                    pass
+
+    return 0  # 如果所有重试都失败
+
+
+def process_rss_to_digest(db_path=DB_PATH, limit=200, group_by='account'):
+    """
+    将数据库中未处理的RSS条目按账号或日期合并生成PDF合集
+
+    参数:
+    - db_path: 数据库路径，或postgresql://开头的PostgreSQL连接串
+    - limit: 每次处理的最大条目数
+    - group_by: 分组方式，account表示按账号，day表示按发布日期
+
+    返回:
+    - 成功处理的条目数
+    """
+    if group_by not in ('account', 'day'):
+        raise ValueError(f"不支持的分组方式: {group_by}")
+
+    worker_id = default_worker_id()
+
+    # 添加重试机制处理数据库锁定问题
+    max_retries = 5
+    retry_delay = 1  # 初始延迟1秒
+
+    for attempt in range(max_retries):
+        try:
+            repo = get_repository(db_path)
+
+            # 认领未处理的RSS条目，按发布时间排序以便目录有序
+            items = repo.claim_unprocessed(limit, worker_id, order_by='created_at')
+            processed_count = 0
+            groups = {}
+
+            for item in items:
+                (article_id, message_id, title, content, account_name, from_user, created_at, raw_data,
+                 extracted_author, extracted_date, extracted_text) = item
+
+                if not content:
+                    print(f"跳过无内容的文章: {title}")
+                    # 标记为已处理，但不生成PDF
+                    if repo.mark_processed(article_id, worker_id):
+                        processed_count += 1
+                    continue
+
+                print(f"准备文章: {title} ({account_name})")
+
+                # 获取作者和日期信息
+                author, date_modified = resolve_author_date(
+                    account_name, from_user, created_at, raw_data, extracted_author, extracted_date)
+
+                if group_by == 'account':
+                    group_key = account_name or 'unknown'
+                else:
+                    group_key = format_article_date(date_modified)[:10] or 'unknown'
+
+                full_html, image_paths = prepare_article_html(
+                    content, title, article_id, author, date_modified)
+                # 下载图片耗时较长，每篇文章准备完后续期认领，避免被其他进程当作失效认领接管
+                repo.renew_claims(worker_id)
+                groups.setdefault(group_key, []).append({
+                    'id': article_id,
+                    'title': title,
+                    'html': full_html,
+                    'image_paths': image_paths,
+                })
+
+            for group_key, articles in groups.items():
+                pdf_path = render_pdf_digest(articles, group_key)
+                repo.renew_claims(worker_id)
+                if not pdf_path:
+                    continue
+
+                # 合集中的每篇文章都指向同一个PDF
+                marked_count = 0
+                for article in articles:
+                    if repo.mark_processed(
+                            article['id'], worker_id, pdf_path, article['image_paths'], {'pdf': pdf_path}):
+                        marked_count += 1
+                processed_count += marked_count
+
+                print(f"已更新数据库: {group_key} ({marked_count}篇)")
 
-            conn.close()
             return processed_count
 
         except sqlite3.OperationalError as e:
@@ -375,10 +655,11 @@ def process_rss_to_pdf(db_path=DB_PATH, limit=10):
                 print(f"数据库错误: {e}")
                 raise
         finally:
-            # 确保连接被关闭
-            if 'conn' in locals() and conn:
+            # 释放未完成的认领并确保连接被关闭
+            if 'repo' in locals() and repo:
                 try:
-                    conn.close()
+                    repo.release_claims(worker_id)
+                    repo.close()
                 except:
                     pass
 
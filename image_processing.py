@@ -0,0 +1,238 @@
+import os
+import atexit
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup
+from PIL import Image
+
+# 处理后图片的缓存目录（按内容哈希命名，可被多篇文章复用）
+IMAGE_CACHE_DIR = "/home/yy/project/Gewechat/vxbot/data/articles/image_cache"
+
+# A4纸宽8.27英寸，减去左右各0.75英寸的页边距即为正文可用宽度
+PAGE_CONTENT_WIDTH_IN = 8.27 - 0.75 * 2
+# 图片的目标分辨率，超过该分辨率的像素在PDF中并不能带来更清晰的效果
+IMAGE_DPI = 150
+MAX_IMAGE_WIDTH = int(PAGE_CONTENT_WIDTH_IN * IMAGE_DPI)
+JPEG_QUALITY = 80
+
+# PNG颜色数超过该值时视为照片，转为JPEG
+PHOTO_MIN_COLORS = 256
+
+# 模块级进程池，首次需要并行处理时创建，供所有文章复用
+_executor = None
+
+
+def get_executor(max_workers=None):
+    """
+    获取模块级进程池，不存在时创建
+
+    参数:
+    - max_workers: 进程池大小，默认为CPU核数；仅在首次创建时生效
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max_workers)
+    return _executor
+
+
+@atexit.register
+def shutdown_executor():
+    """
+    关闭模块级进程池
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+def _cache_key(data, max_width, quality):
+    """
+    根据图片内容和处理参数生成缓存键
+    """
+    digest = hashlib.sha1(data)
+    digest.update(f"{max_width}:{quality}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _find_cached(cache_dir, key):
+    """
+    查找已缓存的处理结果
+    """
+    for ext in ('.jpg', '.png'):
+        cached_path = os.path.join(cache_dir, key + ext)
+        if os.path.exists(cached_path):
+            # 更新修改时间，避免正在使用的缓存被清理任务当作过期文件删除
+            try:
+                os.utime(cached_path)
+            except OSError:
+                pass
+            return cached_path
+    return None
+
+
+def _is_photo(img):
+    """
+    判断PNG图片是否为照片（颜色丰富且没有透明区域）
+    """
+    if img.mode in ('RGBA', 'LA') or 'transparency' in img.info:
+        alpha = img.convert('RGBA').getchannel('A')
+        if alpha.getextrema()[0] < 255:
+            return False
+    return img.getcolors(maxcolors=PHOTO_MIN_COLORS) is None
+
+
+def _flatten(img):
+    """
+    将带透明通道的图片合成到白色背景上，转换为RGB模式
+    """
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def _render_image(src_path, key, max_width, quality, cache_dir):
+    """
+    缩放并重新压缩图片，写入缓存目录；调用方已确认缓存未命中
+    """
+    try:
+        with Image.open(src_path) as img:
+            # GIF只保留第一帧
+            if img.format == 'GIF':
+                img.seek(0)
+                to_jpeg = True
+            elif img.format == 'PNG':
+                to_jpeg = _is_photo(img)
+            else:
+                to_jpeg = True
+
+            img = _flatten(img) if to_jpeg else img.copy()
+
+        resized = img.width > max_width
+        if resized:
+            height = max(1, round(img.height * max_width / img.width))
+            img = img.resize((max_width, height), Image.LANCZOS)
+
+        ext = '.jpg' if to_jpeg else '.png'
+        out_path = os.path.join(cache_dir, key + ext)
+        # 先写入临时文件再重命名，避免并发进程读到不完整的文件
+        tmp_path = f"{out_path}.{os.getpid()}.tmp"
+        if to_jpeg:
+            img.save(tmp_path, 'JPEG', quality=quality,
+                     optimize=True, progressive=True)
+        else:
+            img.save(tmp_path, 'PNG', optimize=True)
+
+        # 未缩放且体积没有变小时，直接缓存原始文件
+        if not resized and os.path.splitext(src_path)[1].lower() == ext \
+                and os.path.getsize(tmp_path) >= os.path.getsize(src_path):
+            shutil.copyfile(src_path, tmp_path)
+
+        os.replace(tmp_path, out_path)
+        return out_path
+    except Exception as e:
+        print(f"处理图片失败: {src_path}, 错误: {e}")
+        return src_path
+
+
+def _lookup_cache(src_path, max_width, quality, cache_dir):
+    """
+    计算图片的缓存键并查找缓存
+
+    返回:
+    - (缓存键, 已缓存的路径)，读取失败时缓存键为None，未命中时路径为None
+    """
+    try:
+        with open(src_path, 'rb') as f:
+            key = _cache_key(f.read(), max_width, quality)
+    except OSError as e:
+        print(f"读取图片失败: {src_path}, 错误: {e}")
+        return None, None
+    return key, _find_cached(cache_dir, key)
+
+
+def process_image(src_path, max_width=MAX_IMAGE_WIDTH, quality=JPEG_QUALITY, cache_dir=IMAGE_CACHE_DIR):
+    """
+    对单张图片进行缩放和重新压缩
+
+    参数:
+    - src_path: 原始图片路径
+    - max_width: 最大宽度（像素），超过时按比例缩小
+    - quality: JPEG压缩质量
+    - cache_dir: 缓存目录
+
+    返回:
+    - 处理后的图片路径，处理失败时返回原始路径
+    """
+    key, cached_path = _lookup_cache(src_path, max_width, quality, cache_dir)
+    if key is None:
+        return src_path
+    if cached_path:
+        return cached_path
+    return _render_image(src_path, key, max_width, quality, cache_dir)
+
+
+def optimize_images(html_content, image_paths, max_width=MAX_IMAGE_WIDTH, quality=JPEG_QUALITY,
+                    cache_dir=IMAGE_CACHE_DIR, executor=None):
+    """
+    批量处理已下载的图片，并替换HTML中的图片路径
+
+    参数:
+    - html_content: 图片已替换为本地路径的HTML内容
+    - image_paths: 本地图片路径列表
+    - max_width: 最大宽度（像素）
+    - quality: JPEG压缩质量
+    - cache_dir: 缓存目录
+    - executor: 处理未命中缓存图片的进程池，默认使用模块级进程池
+
+    返回:
+    - 替换后的HTML内容和处理后的图片路径列表
+    """
+    if not image_paths:
+        return html_content, image_paths
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # 先在当前进程中查找缓存，只把未命中的图片交给进程池
+    path_map = {}
+    misses = []
+    for src_path in image_paths:
+        key, cached_path = _lookup_cache(src_path, max_width, quality, cache_dir)
+        if key is None:
+            path_map[src_path] = src_path
+        elif cached_path:
+            path_map[src_path] = cached_path
+        else:
+            misses.append((src_path, key))
+
+    if len(misses) > 1:
+        executor = executor or get_executor()
+        futures = [(src_path, executor.submit(_render_image, src_path, key, max_width, quality, cache_dir))
+                   for src_path, key in misses]
+        for src_path, future in futures:
+            path_map[src_path] = future.result()
+    else:
+        for src_path, key in misses:
+            path_map[src_path] = _render_image(src_path, key, max_width, quality, cache_dir)
+
+    new_paths = [path_map[src_path] for src_path in image_paths]
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for img in soup.find_all('img'):
+        src = img.get('src', '')
+        if src in path_map:
+            img['src'] = path_map[src]
+
+    # 删除已被缓存文件替代的原始图片
+    for old_path, new_path in path_map.items():
+        if old_path != new_path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    return str(soup), new_paths
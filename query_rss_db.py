@@ -0,0 +1,248 @@
+import sqlite3
+from archive_rss_db import ARCHIVE_DB_PATH, load_archived
+
+DB_PATH = "/home/yy/project/Gewechat/vxbot/data/message_monitor.db"
+
+# wechat_articles表中允许查询的列
+ARTICLE_COLUMNS = (
+    'id', 'message_id', 'from_user', 'title', 'url', 'content', 'cover_url',
+    'pdf_path', 'images', 'created_at', 'raw_data', 'processed', 'process_time',
+    'account_name', 'article_type'
+)
+
+# article_extracts表中的预提取列，请求时自动关联查询
+EXTRACT_COLUMNS = ('text', 'word_count', 'image_urls', 'published_at')
+
+# 归档后从热库中移除、需要从归档库读取的列
+ARCHIVED_COLUMNS = ('content', 'raw_data')
+
+# 默认只返回轻量列，content和raw_data需要显式指定
+DEFAULT_COLUMNS = (
+    'id', 'title', 'url', 'account_name', 'created_at', 'processed', 'pdf_path'
+)
+
+def _check_sqlite(db_path):
+    if db_path.startswith(('postgresql://', 'postgres://')):
+        raise ValueError("分页查询仅支持SQLite数据库")
+
+
+def ensure_query_indexes(db_path=DB_PATH):
+    """
+    创建分页查询所需的索引（如果不存在）
+
+    参数:
+    - db_path: 数据库文件路径
+    """
+    _check_sqlite(db_path)
+    conn = sqlite3.connect(db_path, timeout=20)
+    try:
+        # 按COALESCE表达式建的索引无法用于游标定位，不再使用
+        conn.execute("DROP INDEX IF EXISTS idx_wechat_articles_type_sort")
+        conn.execute("DROP INDEX IF EXISTS idx_wechat_articles_account_sort")
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_wechat_articles_type_created
+            ON wechat_articles (article_type, created_at, id)
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_wechat_articles_account_created
+            ON wechat_articles (account_name, created_at, id)
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _build_query(columns, account_name, start_date, end_date, processed, has_pdf, after, descending, limit,
+                 null_segment):
+    """
+    构建带过滤条件和游标分页的查询语句
+
+    created_at为NULL的条目无法参与(created_at, id)的行值比较，单独作为一段查询：
+    null_segment为True时只查询这些条目并按id分页，否则只查询created_at非空的条目
+    """
+    unknown_columns = [col for col in columns
+                       if col not in ARTICLE_COLUMNS and col not in EXTRACT_COLUMNS]
+    if unknown_columns:
+        raise ValueError(f"不支持的列: {', '.join(unknown_columns)}")
+
+    # 游标依赖created_at和id，始终查询这两列
+    select_columns = list(columns)
+    for col in ('created_at', 'id'):
+        if col not in select_columns:
+            select_columns.append(col)
+
+    select_sql = ', '.join(
+        f"e.{col}" if col in EXTRACT_COLUMNS else f"w.{col}" for col in select_columns)
+    from_sql = "wechat_articles w"
+    if any(col in EXTRACT_COLUMNS for col in select_columns):
+        from_sql += " LEFT JOIN article_extracts e ON e.article_id = w.id"
+
+    conditions = ["w.article_type = 'RSS'"]
+    params = []
+
+    if account_name:
+        conditions.append("w.account_name = ?")
+        params.append(account_name)
+    if start_date:
+        conditions.append("w.created_at >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append("w.created_at < ?")
+        params.append(end_date)
+    if processed is not None:
+        conditions.append("w.processed = ?")
+        params.append(1 if processed else 0)
+    if has_pdf is not None:
+        if has_pdf:
+            conditions.append("w.pdf_path IS NOT NULL AND w.pdf_path != ''")
+        else:
+            conditions.append("(w.pdf_path IS NULL OR w.pdf_path = '')")
+
+    op = '<' if descending else '>'
+    order = 'DESC' if descending else 'ASC'
+    if null_segment:
+        conditions.append("w.created_at IS NULL")
+        if after:
+            conditions.append(f"w.id {op} ?")
+            params.append(after[1])
+        order_sql = f"w.id {order}"
+    else:
+        if after:
+            # 行值比较可以直接利用(created_at, id)索引定位到游标位置
+            conditions.append(f"(w.created_at, w.id) {op} (?, ?)")
+            params.extend(after)
+        else:
+            conditions.append("w.created_at IS NOT NULL")
+        order_sql = f"w.created_at {order}, w.id {order}"
+
+    sql = f"""
+        SELECT {select_sql}
+        FROM {from_sql}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order_sql}
+        LIMIT ?
+    """
+    params.append(limit)
+    return sql, params, select_columns
+
+
+def _query_page(conn, columns, account_name, start_date, end_date, processed, has_pdf, after, descending, limit,
+                archive_path=ARCHIVE_DB_PATH):
+    """
+    查询一页文章，返回条目列表和下一页游标；已归档文章的content和raw_data从归档库读取
+    """
+    # 与SQLite的NULL排序一致：正序时created_at为NULL的条目在前，倒序时在后
+    segments = [False, True] if descending else [True, False]
+    if after:
+        # 游标中created_at为None说明上一页停在NULL段
+        segments = segments[segments.index(after[0] is None):]
+
+    cursor = conn.cursor()
+    items = []
+    item_ids = []
+    next_cursor = None
+    for null_segment in segments:
+        sql, params, select_columns = _build_query(
+            columns, account_name, start_date, end_date, processed, has_pdf, after, descending,
+            limit - len(items), null_segment)
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            record = dict(zip(select_columns, row))
+            next_cursor = (record['created_at'], record['id'])
+            items.append({col: record[col] for col in columns})
+            item_ids.append(record['id'])
+        if len(items) >= limit:
+            break
+        # 游标只作用于它所在的段，后续段从头开始
+        after = None
+
+    # 不足一页说明已经没有更多数据
+    if len(items) < limit:
+        next_cursor = None
+
+    # 已归档文章的字段在热库中为空，从归档库补齐
+    archived_columns = [col for col in ARCHIVED_COLUMNS if col in columns]
+    if archived_columns:
+        missing_ids = [article_id for article_id, item in zip(item_ids, items)
+                       if all(item[col] is None for col in archived_columns)]
+        archived = load_archived(missing_ids, archive_path)
+        for article_id, item in zip(item_ids, items):
+            if article_id in archived:
+                for col in archived_columns:
+                    item[col] = archived[article_id][col]
+
+    return items, next_cursor
+
+
+def list_articles(db_path=DB_PATH, account_name=None, start_date=None, end_date=None, processed=None,
+                  has_pdf=None, columns=DEFAULT_COLUMNS, after=None, descending=True, limit=50,
+                  archive_path=ARCHIVE_DB_PATH):
+    """
+    按条件分页查询RSS文章，使用(created_at, id)游标分页；created_at为NULL的条目正序时排在最前，倒序时排在最后
+
+    参数:
+    - db_path: 数据库文件路径
+    - account_name: 账号名称
+    - start_date: 开始时间（包含），与created_at同格式的字符串
+    - end_date: 结束时间（不包含）
+    - processed: 是否已处理，None表示不限
+    - has_pdf: 是否已生成PDF，None表示不限
+    - columns: 返回的列，默认不包含content和raw_data；可包含text、word_count等预提取列
+    - after: 上一页返回的next_cursor
+    - descending: 是否按时间倒序
+    - limit: 每页条目数
+    - archive_path: 归档库文件路径，已归档文章的content和raw_data从中读取
+
+    返回:
+    - 包含items和next_cursor的字典，next_cursor为None表示没有下一页
+    """
+    _check_sqlite(db_path)
+    try:
+        conn = sqlite3.connect(db_path, timeout=10)
+        try:
+            items, next_cursor = _query_page(
+                conn, columns, account_name, start_date, end_date, processed, has_pdf, after, descending, limit,
+                archive_path)
+        finally:
+            conn.close()
+        return {'items': items, 'next_cursor': next_cursor}
+    except sqlite3.Error as e:
+        print(f"查询文章列表时出错: {e}")
+        return {'items': [], 'next_cursor': None}
+
+
+def iter_articles(db_path=DB_PATH, account_name=None, start_date=None, end_date=None, processed=None,
+                  has_pdf=None, columns=DEFAULT_COLUMNS, descending=False, batch_size=500,
+                  archive_path=ARCHIVE_DB_PATH):
+    """
+    逐条遍历符合条件的RSS文章，适用于导出等需要流式处理的场景
+
+    参数与list_articles相同，batch_size为每次查询的条目数
+
+    返回:
+    - 生成器，每次产出一条文章字典
+    """
+    _check_sqlite(db_path)
+    conn = sqlite3.connect(db_path, timeout=10)
+    try:
+        after = None
+        while True:
+            items, after = _query_page(
+                conn, columns, account_name, start_date, end_date, processed, has_pdf, after, descending,
+                batch_size, archive_path)
+            yield from items
+            if after is None:
+                break
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # 示例: 分页查询最近的文章
+    page = list_articles(limit=5)
+    for item in page['items']:
+        print(f"  {item['title']} ({item['account_name']}) {item['created_at']}")
+
+    if page['next_cursor']:
+        page = list_articles(after=page['next_cursor'], limit=5)
+        print(f"下一页 {len(page['items'])} 条")
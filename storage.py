@@ -0,0 +1,670 @@
+import os
+import json
+import socket
+import sqlite3
+from datetime import datetime, timedelta
+from extract_content import ensure_extract_table, extract_item, save_extract
+
+try:
+    import psycopg2
+    import psycopg2.extras
+except ImportError:  # 仅在使用PostgreSQL时需要
+    psycopg2 = None
+
+# 两种存储实现可能抛出的数据库异常
+DB_ERRORS = (sqlite3.Error, psycopg2.Error) if psycopg2 else (sqlite3.Error,)
+
+DB_PATH = "/home/yy/project/Gewechat/vxbot/data/message_monitor.db"
+
+# 认领超过该时间未续期（renew_claims）的条目视为失效，可被其他进程重新认领
+CLAIM_TIMEOUT_MINUTES = 30
+
+# 只有包含该格式的处理才会将文章标记为已处理，其他格式按article_exports中的导出记录判断是否已导出
+PROCESSED_FORMAT = 'pdf'
+
+# 入库时写入wechat_articles的列
+ARTICLE_INSERT_COLUMNS = (
+    'message_id', 'from_user', 'title', 'url', 'content', 'cover_url', 'raw_data',
+    'processed', 'process_time', 'account_name', 'article_type', 'created_at'
+)
+
+# 认领返回的列，与process_rss_to_pdf中解包的顺序一致；已有提取结果的文章不返回raw_data
+CLAIM_SELECT = """
+    SELECT w.id, w.message_id, w.title, w.content, w.account_name, w.from_user, w.created_at,
+           CASE WHEN e.article_id IS NULL THEN w.raw_data END,
+           e.author, e.published_at, e.text
+"""
+
+# get_stats使用的查询，不带参数，SQLite和PostgreSQL通用
+STATS_TOTAL_SQL = "SELECT COUNT(*) FROM wechat_articles WHERE article_type = 'RSS'"
+STATS_BY_ACCOUNT_SQL = """
+    SELECT account_name, COUNT(*)
+    FROM wechat_articles
+    WHERE article_type = 'RSS'
+    GROUP BY account_name
+    ORDER BY COUNT(*) DESC
+"""
+STATS_RECENT_SQL = """
+    SELECT title, url, account_name, created_at
+    FROM wechat_articles
+    WHERE article_type = 'RSS'
+    ORDER BY created_at DESC
+    LIMIT 10
+"""
+
+POSTGRES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS wechat_articles (
+        id BIGSERIAL PRIMARY KEY,
+        message_id TEXT UNIQUE,
+        from_user TEXT,
+        title TEXT,
+        url TEXT,
+        content TEXT,
+        cover_url TEXT,
+        pdf_path TEXT,
+        images TEXT,
+        created_at TEXT,
+        raw_data TEXT,
+        processed INTEGER DEFAULT 0,
+        process_time TEXT,
+        account_name TEXT,
+        article_type TEXT
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_wechat_articles_account_title
+        ON wechat_articles (account_name, title);
+    CREATE INDEX IF NOT EXISTS idx_wechat_articles_unprocessed
+        ON wechat_articles (id) WHERE processed = 0;
+    CREATE TABLE IF NOT EXISTS article_extracts (
+        article_id BIGINT PRIMARY KEY,
+        text TEXT,
+        word_count INTEGER,
+        image_urls TEXT,
+        author TEXT,
+        published_at TEXT,
+        extracted_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS article_exports (
+        article_id BIGINT NOT NULL,
+        format TEXT NOT NULL,
+        path TEXT NOT NULL,
+        created_at TEXT,
+        PRIMARY KEY (article_id, format)
+    );
+    CREATE TABLE IF NOT EXISTS article_claims (
+        article_id BIGINT PRIMARY KEY,
+        worker TEXT NOT NULL,
+        claimed_at TIMESTAMP NOT NULL
+    );
+"""
+
+
+def is_postgres_dsn(db_path):
+    """
+    判断数据库地址是否为PostgreSQL连接串
+    """
+    return db_path.startswith(('postgresql://', 'postgres://'))
+
+
+def _build_stats(total_count, by_account, recent):
+    """
+    将统计查询的结果整理为字典
+    """
+    return {
+        'total_count': total_count,
+        'by_account': {row[0]: row[1] for row in by_account},
+        'recent_items': [
+            {
+                'title': row[0],
+                'url': row[1],
+                'account_name': row[2],
+                'created_at': row[3]
+            }
+            for row in recent
+        ],
+    }
+
+
+def _pending_condition(formats, placeholder):
+    """
+    生成待处理条目的筛选条件
+
+    参数:
+    - formats: 本次处理的导出格式，为None或包含PROCESSED_FORMAT时按processed状态筛选，
+      否则筛选缺少任一格式导出记录的有内容条目
+    - placeholder: 参数占位符，SQLite为?，PostgreSQL为%s
+
+    返回:
+    - 条件SQL和参数列表
+    """
+    if formats is None or PROCESSED_FORMAT in formats:
+        return "w.processed = 0", []
+    missing = ' OR '.join(
+        f"NOT EXISTS (SELECT 1 FROM article_exports x WHERE x.article_id = w.id AND x.format = {placeholder})"
+        for _ in formats)
+    return f"w.content IS NOT NULL AND w.content != '' AND ({missing})", list(formats)
+
+
+def default_worker_id():
+    """
+    生成当前进程的认领标识
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def ensure_export_table(cursor):
+    """
+    创建记录导出文件的表（如果不存在）
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS article_exports (
+            article_id INTEGER NOT NULL,
+            format TEXT NOT NULL,
+            path TEXT NOT NULL,
+            created_at TEXT,
+            PRIMARY KEY (article_id, format)
+        )
+    """)
+
+
+def record_export(cursor, article_id, fmt, path):
+    """
+    记录文章的导出文件路径
+    """
+    cursor.execute("""
+        INSERT OR REPLACE INTO article_exports (article_id, format, path, created_at)
+        VALUES (?, ?, ?, ?)
+    """, (article_id, fmt, path, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def ensure_claim_table(cursor):
+    """
+    创建记录处理认领的表（如果不存在）
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS article_claims (
+            article_id INTEGER PRIMARY KEY,
+            worker TEXT NOT NULL,
+            claimed_at TEXT NOT NULL
+        )
+    """)
+
+
+class SQLiteRepository:
+    """
+    基于SQLite文件的存储实现，适用于单机部署
+    """
+
+    def __init__(self, db_path=DB_PATH, timeout=20):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=timeout)
+
+    def close(self):
+        self.conn.close()
+
+    def init_schema(self):
+        """
+        创建附属表（wechat_articles表由现有数据库提供）
+        """
+        cursor = self.conn.cursor()
+        ensure_extract_table(cursor)
+        ensure_export_table(cursor)
+        ensure_claim_table(cursor)
+        self.conn.commit()
+
+    def insert_articles(self, articles):
+        """
+        批量插入文章及其提取结果，按标题和账号去重
+
+        参数:
+        - articles: 文章字典列表，包含ARTICLE_INSERT_COLUMNS中的字段和原始RSS条目item
+
+        返回:
+        - 成功存储的条目数量
+        """
+        cursor = self.conn.cursor()
+        stored_count = 0
+
+        for article in articles:
+            title = article['title']
+            account_name = article['account_name']
+
+            # 检查标题是否已存在 - 使用内联查询而不是单独函数调用
+            cursor.execute(
+                "SELECT 1 FROM wechat_articles WHERE title = ? AND account_name = ?",
+                (title, account_name)
+            )
+            if cursor.fetchone():
+                print(f"标题已存在: {title} ({account_name})")
+                continue
+
+            try:
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO wechat_articles
+                    ({', '.join(ARTICLE_INSERT_COLUMNS)})
+                    VALUES ({', '.join('?' * len(ARTICLE_INSERT_COLUMNS))})
+                """, tuple(article[col] for col in ARTICLE_INSERT_COLUMNS))
+
+                if cursor.rowcount > 0:
+                    # 只为新插入的文章提取纯文本、字数和图片列表，重复条目不做HTML解析
+                    save_extract(cursor, cursor.lastrowid, extract_item(article['item']))
+                    stored_count += 1
+                    print(f"已存储: {title} ({account_name})")
+                else:
+                    print(f"已存在: {title} ({account_name})")
+
+            except sqlite3.Error as e:
+                print(f"数据库错误: {e} - {title}")
+                continue
+
+        self.conn.commit()
+        return stored_count
+
+    def claim_unprocessed(self, limit, worker_id, order_by='id', formats=None):
+        """
+        认领未处理的RSS条目，已被其他进程认领的条目会被跳过
+
+        参数:
+        - limit: 最大认领条目数
+        - worker_id: 认领者标识
+        - order_by: 排序方式，id或created_at
+        - formats: 本次处理的导出格式，不包含pdf时认领尚未导出这些格式的条目
+
+        返回:
+        - 认领到的条目列表，列顺序见CLAIM_SELECT
+        """
+        order = 'w.created_at, w.id' if order_by == 'created_at' else 'w.id'
+        pending_sql, pending_params = _pending_condition(formats, '?')
+        now = datetime.now()
+        stale_time = (now - timedelta(minutes=CLAIM_TIMEOUT_MINUTES)
+                      ).strftime('%Y-%m-%d %H:%M:%S')
+
+        self.conn.commit()
+        cursor = self.conn.cursor()
+        # 立即获取写锁，避免多个进程认领到同一条目
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute(
+                "DELETE FROM article_claims WHERE claimed_at < ?", (stale_time,))
+            cursor.execute(f"""
+                INSERT INTO article_claims (article_id, worker, claimed_at)
+                SELECT w.id, ?, ?
+                FROM wechat_articles w
+                LEFT JOIN article_claims c ON c.article_id = w.id
+                WHERE w.article_type = 'RSS' AND {pending_sql} AND c.article_id IS NULL
+                ORDER BY {order}
+                LIMIT ?
+            """, (worker_id, now.strftime('%Y-%m-%d %H:%M:%S'), *pending_params, limit))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+        cursor.execute(f"""
+            {CLAIM_SELECT}
+            FROM wechat_articles w
+            JOIN article_claims c ON c.article_id = w.id
+            LEFT JOIN article_extracts e ON e.article_id = w.id
+            WHERE c.worker = ? AND {pending_sql}
+            ORDER BY {order}
+        """, (worker_id, *pending_params))
+        return cursor.fetchall()
+
+    def mark_processed(self, article_id, worker_id, pdf_path=None, image_paths=None, exports=None,
+                       processed=True):
+        """
+        标记条目为已处理，记录导出文件并释放认领；认领已失效或被其他进程接管时不做任何修改
+
+        参数:
+        - article_id: 文章ID
+        - worker_id: 认领者标识
+        - pdf_path: PDF文件路径
+        - image_paths: 本地图片路径列表，为None时只更新处理状态
+        - exports: 格式到文件路径的字典
+        - processed: 为False时只记录导出文件并释放认领，不修改文章的处理状态
+
+        返回:
+        - 是否标记成功
+        """
+        cursor = self.conn.cursor()
+        try:
+            # 先删除自己的认领，删除不到说明认领已不属于当前进程
+            cursor.execute(
+                "DELETE FROM article_claims WHERE article_id = ? AND worker = ?", (article_id, worker_id))
+            if cursor.rowcount == 0:
+                self.conn.rollback()
+                print(f"认领已失效，跳过标记: {article_id}")
+                return False
+
+            process_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            if processed and image_paths is None:
+                cursor.execute("""
+                    UPDATE wechat_articles
+                    SET processed = 1, process_time = ?
+                    WHERE id = ?
+                """, (process_time, article_id))
+            elif processed:
+                cursor.execute("""
+                    UPDATE wechat_articles
+                    SET processed = 1, process_time = ?, pdf_path = ?, images = ?
+                    WHERE id = ?
+                """, (process_time, pdf_path, json.dumps(image_paths), article_id))
+            for fmt, path in (exports or {}).items():
+                record_export(cursor, article_id, fmt, path)
+            self.conn.commit()
+            return True
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def renew_claims(self, worker_id):
+        """
+        刷新认领者所有认领的时间，长时间运行的批次需定期调用以免认领被视为失效
+        """
+        self.conn.execute(
+            "UPDATE article_claims SET claimed_at = ? WHERE worker = ?",
+            (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), worker_id))
+        self.conn.commit()
+
+    def release_claims(self, worker_id):
+        """
+        释放认领者尚未完成的条目，供下次重新处理
+        """
+        self.conn.execute(
+            "DELETE FROM article_claims WHERE worker = ?", (worker_id,))
+        self.conn.commit()
+
+    def article_exists(self, message_id):
+        """
+        检查message_id对应的条目是否已存在
+        """
+        cursor = self.conn.execute(
+            "SELECT 1 FROM wechat_articles WHERE message_id = ?", (message_id,))
+        return cursor.fetchone() is not None
+
+    def title_exists(self, title, account_name=None):
+        """
+        检查标题相同的RSS条目是否已存在，可按账号限定
+        """
+        if account_name:
+            cursor = self.conn.execute(
+                "SELECT 1 FROM wechat_articles WHERE title = ? AND account_name = ? AND article_type = 'RSS'",
+                (title, account_name)
+            )
+        else:
+            cursor = self.conn.execute(
+                "SELECT 1 FROM wechat_articles WHERE title = ? AND article_type = 'RSS'",
+                (title,)
+            )
+        return cursor.fetchone() is not None
+
+    def get_stats(self):
+        """
+        获取RSS条目的统计信息，结构见store_rss_db.get_rss_stats
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(STATS_TOTAL_SQL)
+        total_count = cursor.fetchone()[0]
+        cursor.execute(STATS_BY_ACCOUNT_SQL)
+        by_account = cursor.fetchall()
+        cursor.execute(STATS_RECENT_SQL)
+        return _build_stats(total_count, by_account, cursor.fetchall())
+
+
+class PostgresRepository:
+    """
+    基于PostgreSQL的存储实现，多台机器可共享同一个归档并并行渲染
+    """
+
+    def __init__(self, dsn):
+        if psycopg2 is None:
+            raise ImportError("使用PostgreSQL需要安装psycopg2: pip install psycopg2-binary")
+        self.dsn = dsn
+        self.conn = psycopg2.connect(dsn)
+
+    def close(self):
+        self.conn.close()
+
+    def init_schema(self):
+        """
+        创建所有表和索引
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(POSTGRES_SCHEMA)
+        self.conn.commit()
+
+    def insert_articles(self, articles):
+        """
+        多行插入文章及其提取结果，由唯一约束去重
+
+        参数:
+        - articles: 文章字典列表，包含ARTICLE_INSERT_COLUMNS中的字段和原始RSS条目item
+
+        返回:
+        - 成功存储的条目数量
+        """
+        if not articles:
+            return 0
+
+        by_message_id = {article['message_id']: article for article in articles}
+        with self.conn.cursor() as cursor:
+            # message_id或(account_name, title)冲突时跳过
+            inserted = psycopg2.extras.execute_values(cursor, f"""
+                INSERT INTO wechat_articles ({', '.join(ARTICLE_INSERT_COLUMNS)})
+                VALUES %s
+                ON CONFLICT DO NOTHING
+                RETURNING id, message_id
+            """, [tuple(article[col] for col in ARTICLE_INSERT_COLUMNS) for article in articles],
+                page_size=500, fetch=True)
+
+            extracted_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            extract_rows = []
+            # 只为RETURNING返回的新插入文章做提取
+            for article_id, message_id in inserted:
+                article = by_message_id[message_id]
+                extract = extract_item(article['item'])
+                extract_rows.append((
+                    article_id,
+                    extract['text'],
+                    extract['word_count'],
+                    json.dumps(extract['image_urls'], ensure_ascii=False),
+                    extract['author'],
+                    extract['published_at'],
+                    extracted_at
+                ))
+                print(f"已存储: {article['title']} ({article['account_name']})")
+
+            if extract_rows:
+                psycopg2.extras.execute_values(cursor, """
+                    INSERT INTO article_extracts
+                    (article_id, text, word_count, image_urls, author, published_at, extracted_at)
+                    VALUES %s
+                    ON CONFLICT (article_id) DO NOTHING
+                """, extract_rows, page_size=500)
+
+        self.conn.commit()
+        skipped = len(articles) - len(inserted)
+        if skipped:
+            print(f"已存在: {skipped} 条")
+        return len(inserted)
+
+    def claim_unprocessed(self, limit, worker_id, order_by='id', formats=None):
+        """
+        使用SKIP LOCKED认领未处理的RSS条目，多个进程可以并发认领
+
+        参数:
+        - limit: 最大认领条目数
+        - worker_id: 认领者标识
+        - order_by: 排序方式，id或created_at
+        - formats: 本次处理的导出格式，不包含pdf时认领尚未导出这些格式的条目
+
+        返回:
+        - 认领到的条目列表，列顺序见CLAIM_SELECT
+        """
+        order = 'w.created_at, w.id' if order_by == 'created_at' else 'w.id'
+        pending_sql, pending_params = _pending_condition(formats, '%s')
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM article_claims WHERE claimed_at < now() - %s * interval '1 minute'",
+                (CLAIM_TIMEOUT_MINUTES,))
+            cursor.execute(f"""
+                WITH candidates AS (
+                    SELECT w.id
+                    FROM wechat_articles w
+                    WHERE w.article_type = 'RSS' AND {pending_sql}
+                      AND NOT EXISTS (SELECT 1 FROM article_claims c WHERE c.article_id = w.id)
+                    ORDER BY {order}
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                INSERT INTO article_claims (article_id, worker, claimed_at)
+                SELECT id, %s, now() FROM candidates
+                ON CONFLICT (article_id) DO NOTHING
+                RETURNING article_id
+            """, (*pending_params, limit, worker_id))
+            claimed_ids = [row[0] for row in cursor.fetchall()]
+            self.conn.commit()
+
+            if not claimed_ids:
+                return []
+
+            cursor.execute(f"""
+                {CLAIM_SELECT}
+                FROM wechat_articles w
+                LEFT JOIN article_extracts e ON e.article_id = w.id
+                WHERE w.id = ANY(%s)
+                ORDER BY {order}
+            """, (claimed_ids,))
+            rows = cursor.fetchall()
+        self.conn.commit()
+        return rows
+
+    def mark_processed(self, article_id, worker_id, pdf_path=None, image_paths=None, exports=None,
+                       processed=True):
+        """
+        标记条目为已处理，记录导出文件并释放认领；认领已失效或被其他进程接管时不做任何修改
+
+        参数:
+        - article_id: 文章ID
+        - worker_id: 认领者标识
+        - pdf_path: PDF文件路径
+        - image_paths: 本地图片路径列表，为None时只更新处理状态
+        - exports: 格式到文件路径的字典
+        - processed: 为False时只记录导出文件并释放认领，不修改文章的处理状态
+
+        返回:
+        - 是否标记成功
+        """
+        process_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.conn.cursor() as cursor:
+            # 先删除自己的认领（同时锁住该行），删除不到说明认领已不属于当前进程
+            cursor.execute(
+                "DELETE FROM article_claims WHERE article_id = %s AND worker = %s", (article_id, worker_id))
+            if cursor.rowcount == 0:
+                self.conn.rollback()
+                print(f"认领已失效，跳过标记: {article_id}")
+                return False
+
+            if processed and image_paths is None:
+                cursor.execute("""
+                    UPDATE wechat_articles
+                    SET processed = 1, process_time = %s
+                    WHERE id = %s
+                """, (process_time, article_id))
+            elif processed:
+                cursor.execute("""
+                    UPDATE wechat_articles
+                    SET processed = 1, process_time = %s, pdf_path = %s, images = %s
+                    WHERE id = %s
+                """, (process_time, pdf_path, json.dumps(image_paths), article_id))
+            for fmt, path in (exports or {}).items():
+                self._record_export(cursor, article_id, fmt, path)
+        self.conn.commit()
+        return True
+
+    def renew_claims(self, worker_id):
+        """
+        刷新认领者所有认领的时间，长时间运行的批次需定期调用以免认领被视为失效
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE article_claims SET claimed_at = now() WHERE worker = %s", (worker_id,))
+        self.conn.commit()
+
+    def release_claims(self, worker_id):
+        """
+        释放认领者尚未完成的条目，供下次重新处理
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM article_claims WHERE worker = %s", (worker_id,))
+        self.conn.commit()
+
+    def article_exists(self, message_id):
+        """
+        检查message_id对应的条目是否已存在
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM wechat_articles WHERE message_id = %s", (message_id,))
+            exists = cursor.fetchone() is not None
+        self.conn.commit()
+        return exists
+
+    def title_exists(self, title, account_name=None):
+        """
+        检查标题相同的RSS条目是否已存在，可按账号限定
+        """
+        with self.conn.cursor() as cursor:
+            if account_name:
+                cursor.execute(
+                    "SELECT 1 FROM wechat_articles WHERE title = %s AND account_name = %s AND article_type = 'RSS'",
+                    (title, account_name)
+                )
+            else:
+                cursor.execute(
+                    "SELECT 1 FROM wechat_articles WHERE title = %s AND article_type = 'RSS'",
+                    (title,)
+                )
+            exists = cursor.fetchone() is not None
+        self.conn.commit()
+        return exists
+
+    def get_stats(self):
+        """
+        获取RSS条目的统计信息，结构见store_rss_db.get_rss_stats
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(STATS_TOTAL_SQL)
+            total_count = cursor.fetchone()[0]
+            cursor.execute(STATS_BY_ACCOUNT_SQL)
+            by_account = cursor.fetchall()
+            cursor.execute(STATS_RECENT_SQL)
+            recent = cursor.fetchall()
+        self.conn.commit()
+        return _build_stats(total_count, by_account, recent)
+
+    def _record_export(self, cursor, article_id, fmt, path):
+        cursor.execute("""
+            INSERT INTO article_exports (article_id, format, path, created_at)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (article_id, format)
+            DO UPDATE SET path = EXCLUDED.path, created_at = EXCLUDED.created_at
+        """, (article_id, fmt, path, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def get_repository(db_path=DB_PATH):
+    """
+    根据数据库地址创建存储实例
+
+    参数:
+    - db_path: SQLite文件路径，或postgresql://开头的PostgreSQL连接串
+
+    返回:
+    - SQLiteRepository或PostgresRepository实例（已创建所需的表）
+    """
+    if is_postgres_dsn(db_path):
+        repo = PostgresRepository(db_path)
+    else:
+        repo = SQLiteRepository(db_path)
+    repo.init_schema()
+    return repo
@@ -3,7 +3,8 @@ import json
 from datetime import datetime
 import time
 from rss_tools.fetch_rss import get_all_items
-from html_to_pdf import process_rss_to_pdf
+from html_to_pdf import process_rss_to_pdf, process_rss_to_digest
+from storage import DB_ERRORS, get_repository
 
 DB_PATH = "/home/yy/project/Gewechat/vxbot/data/message_monitor.db"
 
@@ -14,91 +15,53 @@ def store_rss_items_to_db(items, db_path=DB_PATH):
 
     参数:
     - items: RSS条目列表
-    - db_path: 数据库文件路径
+    - db_path: 数据库文件路径，或postgresql://开头的PostgreSQL连接串
 
     返回:
     - 成功存储的条目数量
     """
+    articles = []
+    for item in items:
+        # 提取需要的字段
+        item_id = item.get('id', '')
+        url = item.get('url', '')
+
+        # 从author对象中提取name作为account_name
+        author_obj = item.get('author', {})
+        account_name = author_obj.get(
+            'name', '') if isinstance(author_obj, dict) else ''
+
+        articles.append({
+            # 生成一个唯一的message_id (使用RSS条目的id)
+            'message_id': f"rss_{item_id}" if item_id else f"rss_{hash(url)}",
+            # 使用account_name作为from_user
+            'from_user': account_name,
+            'title': item.get('title', ''),
+            'url': url,
+            'content': item.get('content_html', ''),
+            'cover_url': item.get('image', ''),
+            # 将原始JSON数据存储为raw_data
+            'raw_data': json.dumps(item),
+            'processed': 0,
+            # 当前时间作为处理时间
+            'process_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'account_name': account_name,
+            # 设置文章类型为RSS
+            'article_type': "RSS",
+            # 处理日期
+            'created_at': item.get('date_modified', ''),
+            # 原始条目，插入成功后才提取纯文本、字数和图片列表
+            'item': item,
+        })
+
     # 添加重试机制处理数据库锁定问题
     max_retries = 5
     retry_delay = 1  # 初始延迟1秒
 
     for attempt in range(max_retries):
         try:
-            conn = sqlite3.connect(db_path, timeout=20)  # 增加超时时间
-            cursor = conn.cursor()
-
-            stored_count = 0
-
-            for item in items:
-                # 提取需要的字段
-                item_id = item.get('id', '')
-                title = item.get('title', '')
-                url = item.get('url', '')
-                content = item.get('content_html', '')
-                cover_url = item.get('image', '')
-
-                # 从author对象中提取name作为account_name
-                author_obj = item.get('author', {})
-                account_name = author_obj.get(
-                    'name', '') if isinstance(author_obj, dict) else ''
-
-                # 使用account_name作为from_user
-                from_user = account_name
-
-                # 处理日期
-                date_modified = item.get('date_modified', '')
-
-                # 生成一个唯一的message_id (使用RSS条目的id)
-                message_id = f"rss_{item_id}" if item_id else f"rss_{hash(url)}"
-
-                # 当前时间作为处理时间
-                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-                # 将原始JSON数据存储为raw_data
-                raw_data = json.dumps(item)
-
-                # 设置文章类型为RSS
-                article_type = "RSS"
-
-                # 检查标题是否已存在 - 使用内联查询而不是单独函数调用
-                cursor.execute(
-                    "SELECT 1 FROM wechat_articles WHERE title = ? AND account_name = ?",
-                    (title, account_name)
-                )
-                if cursor.fetchone():
-                    print(f"标题已存在: {title} ({account_name})")
-                    continue
-
-                # 准备SQL语句，只插入我们有数据的字段
-                try:
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO wechat_articles 
-                        (message_id, from_user, title, url, content, 
-                         cover_url, raw_data, processed, process_time, 
-                         account_name, article_type, created_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        message_id, from_user, title, url, content,
-                        cover_url, raw_data, False, current_time,
-                        account_name, article_type, date_modified
-                    ))
-
-                    if cursor.rowcount > 0:
-                        stored_count += 1
-                        print(f"已存储: {title} ({account_name})")
-                    else:
-                        print(f"已存在: {title} ({account_name})")
-
-                except sqlite3.Error as e:
-                    print(f"数据库错误: {e} - {title}")
-                    continue
-
-            # 提交事务并关闭连接
-            conn.commit()
-            conn.close()
-
-            return stored_count
+            repo = get_repository(db_path)
+            return repo.insert_articles(articles)
 
         except sqlite3.OperationalError as e:
             if "database is locked" in str(e) and attempt < max_retries - 1:
@@ -111,16 +74,17 @@ def store_rss_items_to_db(items, db_path=DB_PATH):
                 raise
         finally:
             # 确保连接被关闭
-            if 'conn' in locals() and conn:
+            if 'repo' in locals() and repo:
                 try:
-                    conn.close()
+                    repo.close()
                 except:
                     pass
 
     return 0  # 如果所有重试都失败
 
 
-def fetch_and_store_rss(feed_id="all", title_include=None, title_exclude=None, page_size=5, db_path=DB_PATH):
+def fetch_and_store_rss(feed_id="all", title_include=None, title_exclude=None, page_size=5, db_path=DB_PATH,
+                        item_filter=None):
     """
     获取RSS条目并存储到数据库
 
@@ -130,6 +94,7 @@ def fetch_and_store_rss(feed_id="all", title_include=None, title_exclude=None, p
     - title_exclude: 标题排除的关键词
     - page_size: 获取的页数
     - db_path: 数据库文件路径
+    - item_filter: 本地过滤函数，在入库前丢弃不需要的条目
 
     返回:
     - 存储的条目数量
@@ -139,7 +104,8 @@ def fetch_and_store_rss(feed_id="all", title_include=None, title_exclude=None, p
         feed_id=feed_id,
         title_include=title_include,
         title_exclude=title_exclude,
-        page_size=page_size
+        page_size=page_size,
+        item_filter=item_filter
     )
 
     print(f"获取到 {len(items)} 条RSS条目")
@@ -158,7 +124,7 @@ def check_rss_item_exists(item_id=None, url=None, db_path=DB_PATH):
     参数:
     - item_id: RSS条目的ID
     - url: RSS条目的URL (如果没有提供item_id)
-    - db_path: 数据库文件路径
+    - db_path: 数据库文件路径，或postgresql://开头的PostgreSQL连接串
 
     返回:
     - 如果存在返回True，否则返回False
@@ -168,19 +134,16 @@ def check_rss_item_exists(item_id=None, url=None, db_path=DB_PATH):
 
     message_id = f"rss_{item_id}" if item_id else f"rss_{hash(url)}"
 
+    repo = None
     try:
-        conn = sqlite3.connect(db_path, timeout=10)
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT 1 FROM wechat_articles WHERE message_id = ?", (message_id,))
-        result = cursor.fetchone() is not None
-
-        conn.close()
-        return result
-    except sqlite3.Error as e:
+        repo = get_repository(db_path)
+        return repo.article_exists(message_id)
+    except DB_ERRORS as e:
         print(f"检查条目存在时出错: {e}")
         return False
+    finally:
+        if repo:
+            repo.close()
 
 
 def check_rss_item_exists_by_title(title, account_name=None, db_path=DB_PATH):
@@ -190,7 +153,7 @@ def check_rss_item_exists_by_title(title, account_name=None, db_path=DB_PATH):
     参数:
     - title: RSS条目的标题
     - account_name: 可选的账号名称，用于进一步限定查询范围
-    - db_path: 数据库文件路径
+    - db_path: 数据库文件路径，或postgresql://开头的PostgreSQL连接串
 
     返回:
     - 如果存在返回True，否则返回False
@@ -198,28 +161,16 @@ def check_rss_item_exists_by_title(title, account_name=None, db_path=DB_PATH):
     if not title:
         raise ValueError("必须提供title参数")
 
+    repo = None
     try:
-        conn = sqlite3.connect(db_path, timeout=10)
-        cursor = conn.cursor()
-
-        if account_name:
-            cursor.execute(
-                "SELECT 1 FROM wechat_articles WHERE title = ? AND account_name = ? AND article_type = 'RSS'",
-                (title, account_name)
-            )
-        else:
-            cursor.execute(
-                "SELECT 1 FROM wechat_articles WHERE title = ? AND article_type = 'RSS'",
-                (title,)
-            )
-
-        result = cursor.fetchone() is not None
-
-        conn.close()
-        return result
-    except sqlite3.Error as e:
+        repo = get_repository(db_path)
+        return repo.title_exists(title, account_name)
+    except DB_ERRORS as e:
         print(f"通过标题检查条目存在时出错: {e}")
         return False
+    finally:
+        if repo:
+            repo.close()
 
 
 def get_rss_stats(db_path=DB_PATH):
@@ -227,58 +178,25 @@ def get_rss_stats(db_path=DB_PATH):
     获取数据库中RSS条目的统计信息
 
     参数:
-    - db_path: 数据库文件路径
+    - db_path: 数据库文件路径，或postgresql://开头的PostgreSQL连接串
 
     返回:
     - 包含统计信息的字典
     """
+    repo = None
     try:
-        conn = sqlite3.connect(db_path, timeout=10)
-        cursor = conn.cursor()
-
-        stats = {}
-
-        # 获取RSS条目总数
-        cursor.execute(
-            "SELECT COUNT(*) FROM wechat_articles WHERE article_type = 'RSS'")
-        stats['total_count'] = cursor.fetchone()[0]
-
-        # 获取按账号分组的条目数
-        cursor.execute("""
-            SELECT account_name, COUNT(*) 
-            FROM wechat_articles 
-            WHERE article_type = 'RSS' 
-            GROUP BY account_name
-            ORDER BY COUNT(*) DESC
-        """)
-        stats['by_account'] = {row[0]: row[1] for row in cursor.fetchall()}
-
-        # 获取最近添加的条目
-        cursor.execute("""
-            SELECT title, url, account_name, created_at
-            FROM wechat_articles
-            WHERE article_type = 'RSS'
-            ORDER BY created_at DESC
-            LIMIT 10
-        """)
-        stats['recent_items'] = [
-            {
-                'title': row[0],
-                'url': row[1],
-                'account_name': row[2],
-                'created_at': row[3]
-            }
-            for row in cursor.fetchall()
-        ]
-
-        conn.close()
-        return stats
-    except sqlite3.Error as e:
+        repo = get_repository(db_path)
+        return repo.get_stats()
+    except DB_ERRORS as e:
         print(f"获取RSS统计信息时出错: {e}")
         return {'total_count': 0, 'by_account': {}, 'recent_items': []}
+    finally:
+        if repo:
+            repo.close()
 
 
-def fetch_store_and_process_rss(feed_id="all", title_include=None, title_exclude=None, page_size=5, db_path=DB_PATH, process_pdf=True):
+def fetch_store_and_process_rss(feed_id="all", title_include=None, title_exclude=None, page_size=5, db_path=DB_PATH, process_pdf=True, formats=('pdf',), digest_by=None,
+                                item_filter=None):
     """
     获取RSS条目，存储到数据库，并处理为PDF
 
@@ -288,7 +206,10 @@ def fetch_store_and_process_rss(feed_id="all", title_include=None, title_exclude
     - title_exclude: 标题排除的关键词
     - page_size: 获取的页数
     - db_path: 数据库文件路径
-    - process_pdf: 是否处理PDF
+    - process_pdf: 是否处理PDF（以及其他导出格式）
+    - formats: 导出格式列表，可选pdf、html、md、txt、epub
+    - digest_by: 合集模式，account或day；设置后按分组合并生成PDF，忽略formats
+    - item_filter: 本地过滤函数，在入库前丢弃不需要的条目
 
     返回:
     - 存储的条目数量和处理的PDF数量
@@ -299,14 +220,20 @@ def fetch_store_and_process_rss(feed_id="all", title_include=None, title_exclude
         title_include=title_include,
         title_exclude=title_exclude,
         page_size=page_size,
-        db_path=db_path
+        db_path=db_path,
+        item_filter=item_filter
     )
 
     processed_count = 0
     if process_pdf and stored_count > 0:
         # 处理未处理的RSS条目为PDF
         print("开始处理RSS条目为PDF...")
-        processed_count = process_rss_to_pdf(db_path=db_path)
+        if digest_by:
+            processed_count = process_rss_to_digest(
+                db_path=db_path, group_by=digest_by)
+        else:
+            processed_count = process_rss_to_pdf(
+                db_path=db_path, formats=formats)
         print(f"成功处理 {processed_count} 条RSS条目为PDF")
 
     return stored_count, processed_count
@@ -0,0 +1,294 @@
+"""
+storage模块的存储实现测试
+
+SQLite始终运行；设置RSS2DB_TEST_POSTGRES_DSN环境变量时，同样的用例也在PostgreSQL上运行。
+注意：PostgreSQL测试会清空该数据库中的相关表，请使用专门的测试库。
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from extract_content import extract_item  # noqa: E402
+
+POSTGRES_DSN = os.environ.get('RSS2DB_TEST_POSTGRES_DSN')
+
+# 现有SQLite数据库中的wechat_articles表结构
+SQLITE_ARTICLES_SCHEMA = """
+    CREATE TABLE wechat_articles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message_id TEXT UNIQUE,
+        from_user TEXT,
+        title TEXT,
+        url TEXT,
+        content TEXT,
+        cover_url TEXT,
+        pdf_path TEXT,
+        images TEXT,
+        created_at TEXT,
+        raw_data TEXT,
+        processed INTEGER DEFAULT 0,
+        process_time TEXT,
+        account_name TEXT,
+        article_type TEXT
+    )
+"""
+
+
+def make_article(n, account_name='测试账号'):
+    return {
+        'message_id': f"rss_{n}",
+        'from_user': 'rss_feed',
+        'title': f"文章{n}",
+        'url': f"https://example.com/{n}",
+        'content': f"<p>正文{n}</p>",
+        'cover_url': '',
+        'raw_data': '{}',
+        'processed': 0,
+        'process_time': None,
+        'account_name': account_name,
+        'article_type': 'RSS',
+        'created_at': f"2024-01-{n:02d} 08:00:00",
+        'item': {
+            'id': str(n),
+            'title': f"文章{n}",
+            'content_html': f"<p>正文{n}</p>",
+            'author': {'name': account_name},
+            'date_modified': f"2024-01-{n:02d}T08:00:00+08:00",
+        },
+    }
+
+
+def _open_sqlite(db_path):
+    repo = storage.SQLiteRepository(db_path)
+    repo.init_schema()
+    return repo
+
+
+def _open_postgres(dsn):
+    repo = storage.PostgresRepository(dsn)
+    repo.init_schema()
+    return repo
+
+
+@pytest.fixture(params=[
+    'sqlite',
+    pytest.param('postgres', marks=pytest.mark.skipif(
+        not POSTGRES_DSN, reason="未设置RSS2DB_TEST_POSTGRES_DSN")),
+])
+def open_repo(request, tmp_path):
+    """
+    返回打开存储实例的函数，同一个测试中多次调用得到连接同一数据库的不同实例
+    """
+    repos = []
+
+    if request.param == 'sqlite':
+        db_path = str(tmp_path / 'articles.db')
+        conn = storage.sqlite3.connect(db_path)
+        conn.execute(SQLITE_ARTICLES_SCHEMA)
+        conn.close()
+
+        def opener():
+            repos.append(_open_sqlite(db_path))
+            return repos[-1]
+    else:
+        repo = _open_postgres(POSTGRES_DSN)
+        with repo.conn.cursor() as cursor:
+            cursor.execute("""
+                TRUNCATE wechat_articles, article_extracts, article_exports, article_claims
+                RESTART IDENTITY
+            """)
+        repo.conn.commit()
+        repos.append(repo)
+
+        def opener():
+            repos.append(_open_postgres(POSTGRES_DSN))
+            return repos[-1]
+
+    yield opener
+
+    for repo in repos:
+        repo.close()
+
+
+def _fetch(repo, sql):
+    cursor = repo.conn.cursor()
+    try:
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    repo.conn.commit()
+    return rows
+
+
+def _execute(repo, sql):
+    cursor = repo.conn.cursor()
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.close()
+    repo.conn.commit()
+
+
+def test_insert_articles_dedup(open_repo, monkeypatch):
+    extracted = []
+
+    def counting_extract_item(item):
+        extracted.append(item['id'])
+        return extract_item(item)
+
+    monkeypatch.setattr(storage, 'extract_item', counting_extract_item)
+    repo = open_repo()
+
+    assert repo.insert_articles([make_article(1), make_article(2)]) == 2
+    # 相同message_id、相同账号和标题的条目都会被跳过
+    duplicate_title = make_article(3)
+    duplicate_title['title'] = '文章1'
+    assert repo.insert_articles([make_article(1), duplicate_title, make_article(4)]) == 1
+    # 不同账号的同名文章不算重复
+    assert repo.insert_articles([make_article(5, account_name='其他账号')]) == 1
+    # 只有新插入的文章才会解析HTML
+    assert sorted(extracted) == ['1', '2', '4', '5']
+
+    assert _fetch(repo, "SELECT COUNT(*) FROM wechat_articles")[0][0] == 4
+    # 每篇入库的文章都有对应的提取结果
+    assert _fetch(repo, """
+        SELECT COUNT(*) FROM wechat_articles w
+        JOIN article_extracts e ON e.article_id = w.id
+    """)[0][0] == 4
+
+
+def test_claims_are_disjoint_between_workers(open_repo):
+    repo_a = open_repo()
+    repo_b = open_repo()
+    repo_a.insert_articles([make_article(n) for n in range(1, 8)])
+
+    rows_a = repo_a.claim_unprocessed(4, 'worker-a')
+    rows_b = repo_b.claim_unprocessed(4, 'worker-b')
+    ids_a = {row[0] for row in rows_a}
+    ids_b = {row[0] for row in rows_b}
+
+    assert len(ids_a) == 4
+    assert len(ids_b) == 3
+    assert not ids_a & ids_b
+    # 全部条目都已被认领，再次认领得不到新条目
+    assert repo_b.claim_unprocessed(4, 'worker-c') == []
+
+
+def test_stale_claims_expire(open_repo):
+    repo_a = open_repo()
+    repo_b = open_repo()
+    repo_a.insert_articles([make_article(n) for n in range(1, 4)])
+
+    ids_a = {row[0] for row in repo_a.claim_unprocessed(10, 'worker-a')}
+    assert len(ids_a) == 3
+    assert repo_b.claim_unprocessed(10, 'worker-b') == []
+
+    # 模拟worker-a崩溃：认领时间早于CLAIM_TIMEOUT_MINUTES
+    _execute(repo_a, "UPDATE article_claims SET claimed_at = '2000-01-01 00:00:00'")
+
+    ids_b = {row[0] for row in repo_b.claim_unprocessed(10, 'worker-b')}
+    assert ids_b == ids_a
+    assert _fetch(repo_b, "SELECT DISTINCT worker FROM article_claims") == [('worker-b',)]
+
+
+def test_renewed_claims_do_not_expire(open_repo):
+    repo_a = open_repo()
+    repo_b = open_repo()
+    repo_a.insert_articles([make_article(n) for n in range(1, 4)])
+
+    repo_a.claim_unprocessed(10, 'worker-a')
+    _execute(repo_a, "UPDATE article_claims SET claimed_at = '2000-01-01 00:00:00'")
+    repo_a.renew_claims('worker-a')
+
+    assert repo_b.claim_unprocessed(10, 'worker-b') == []
+
+
+def test_mark_processed_requires_claim(open_repo):
+    repo_a = open_repo()
+    repo_b = open_repo()
+    repo_a.insert_articles([make_article(1)])
+
+    (article_id,) = [row[0] for row in repo_a.claim_unprocessed(10, 'worker-a')]
+    # worker-a的认领失效后被worker-b接管
+    _execute(repo_a, "UPDATE article_claims SET claimed_at = '2000-01-01 00:00:00'")
+    assert [row[0] for row in repo_b.claim_unprocessed(10, 'worker-b')] == [article_id]
+
+    assert not repo_a.mark_processed(article_id, 'worker-a', exports={'pdf': '/tmp/a.pdf'})
+    assert _fetch(repo_a, "SELECT processed FROM wechat_articles") == [(0,)]
+    assert _fetch(repo_a, "SELECT COUNT(*) FROM article_exports")[0][0] == 0
+
+    assert repo_b.mark_processed(article_id, 'worker-b', exports={'pdf': '/tmp/b.pdf'})
+    assert _fetch(repo_b, "SELECT processed FROM wechat_articles") == [(1,)]
+    assert _fetch(repo_b, "SELECT path FROM article_exports") == [('/tmp/b.pdf',)]
+    # 已处理的条目不能再次被标记
+    assert not repo_a.mark_processed(article_id, 'worker-a')
+
+
+def test_mark_processed_and_release_claims(open_repo):
+    repo_a = open_repo()
+    repo_b = open_repo()
+    repo_a.insert_articles([make_article(n) for n in range(1, 4)])
+
+    first, second, third = sorted(row[0] for row in repo_a.claim_unprocessed(10, 'worker-a'))
+
+    assert repo_a.mark_processed(first, 'worker-a', '/tmp/1.pdf', ['/tmp/1.jpg'],
+                                 exports={'pdf': '/tmp/1.pdf', 'md': '/tmp/1.md'})
+    assert repo_a.mark_processed(second, 'worker-a')
+
+    rows = dict((row[0], row[1:]) for row in _fetch(
+        repo_a, "SELECT id, processed, pdf_path FROM wechat_articles"))
+    assert rows[first] == (1, '/tmp/1.pdf')
+    assert rows[second] == (1, None)
+    assert rows[third] == (0, None)
+    assert sorted(_fetch(repo_a, "SELECT format, path FROM article_exports")) == [
+        ('md', '/tmp/1.md'), ('pdf', '/tmp/1.pdf')]
+    # 已处理的条目不再占用认领
+    assert [row[0] for row in _fetch(repo_a, "SELECT article_id FROM article_claims")] == [third]
+
+    # 未释放前其他进程认领不到剩余条目，释放后可以重新认领
+    assert repo_b.claim_unprocessed(10, 'worker-b') == []
+    repo_a.release_claims('worker-a')
+    assert [row[0] for row in repo_b.claim_unprocessed(10, 'worker-b')] == [third]
+
+
+def test_read_helpers(open_repo):
+    repo = open_repo()
+    repo.insert_articles([make_article(1), make_article(2), make_article(3, account_name='其他账号')])
+
+    assert repo.article_exists('rss_1')
+    assert not repo.article_exists('rss_9')
+    assert repo.title_exists('文章1')
+    assert repo.title_exists('文章1', '测试账号')
+    assert not repo.title_exists('文章1', '其他账号')
+
+    stats = repo.get_stats()
+    assert stats['total_count'] == 3
+    assert stats['by_account'] == {'测试账号': 2, '其他账号': 1}
+    assert [item['title'] for item in stats['recent_items']] == ['文章3', '文章2', '文章1']
+
+
+def test_non_pdf_runs_do_not_consume_pdf_backlog(open_repo):
+    repo = open_repo()
+    repo.insert_articles([make_article(n) for n in range(1, 4)])
+
+    txt_ids = sorted(row[0] for row in repo.claim_unprocessed(10, 'worker-a', formats=('txt',)))
+    assert len(txt_ids) == 3
+    for article_id in txt_ids[:2]:
+        assert repo.mark_processed(article_id, 'worker-a', exports={'txt': f"/tmp/{article_id}.txt"},
+                                   processed=False)
+    repo.release_claims('worker-a')
+
+    # 纯文本导出不改变processed，PDF处理仍能认领全部条目
+    assert _fetch(repo, "SELECT COUNT(*) FROM wechat_articles WHERE processed = 0")[0][0] == 3
+    # 已导出txt的条目不会被下一次txt处理重复认领
+    assert [row[0] for row in repo.claim_unprocessed(10, 'worker-b', formats=('txt',))] == [txt_ids[2]]
+    # 请求的格式中有任一尚未导出时仍会被认领
+    assert len(repo.claim_unprocessed(10, 'worker-c', formats=('txt', 'md'))) == 2
+    repo.release_claims('worker-b')
+    repo.release_claims('worker-c')
+
+    assert len(repo.claim_unprocessed(10, 'worker-d', formats=('pdf', 'txt'))) == 3